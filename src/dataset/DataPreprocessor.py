@@ -1,14 +1,19 @@
 """Preprocess the annotation file"""
 
+import fcntl
 import json
 import logging
-from os.path import join, getsize, exists
-from typing import Dict
+from multiprocessing import Pool
+from os import remove, truncate
+from os.path import join, getsize, exists, basename
+from typing import Dict, List, Tuple, Set, Iterable, TextIO, Optional
 
 from openpyxl import load_workbook
 from openpyxl.worksheet.worksheet import Worksheet
 from tqdm import tqdm
 
+from dataset import XlsxProbe
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,62 +24,157 @@ class DataPreprocessor(object):
             preprocessed_annotation_file_name: str,
             remove_hidden=True,
             file_size_cap=1000 * 100,
+            # Number of worker processes, xls files are distributed among them
+            processes=1,
     ):
         self.data_path = data_path
         self.preprocessed_annotation_file_name = preprocessed_annotation_file_name
         self.remove_hidden = remove_hidden
         self.file_size_cap = file_size_cap
+        self.processes = processes
 
     def preprocess(self, dataset_name: str):
         """Creates a new annotation file from the original one.
         Drops invalid xls files (too large, contains hidden, not loadable).
-        Rewrites the annotations to match the table model proposed by Koci et al."""
-        annotation_file_path = join(self.data_path, dataset_name, "annotations_elements.json")
+        Rewrites the annotations to match the table model proposed by Koci et al.
+        Work is distributed per xls file, so every workbook is loaded only once for all its annotated sheets.
+        Finished files are checkpointed, an interrupted run resumes where it stopped.
+        Concurrent runs on the same dataset wait for each other, only the first one preprocesses."""
         preprocessed_annotation_file_path = join(self.data_path, dataset_name, self.preprocessed_annotation_file_name)
-        xls_dir_path = join(self.data_path, dataset_name, "xls")
 
         # Skip if already preprocessed
         if exists(preprocessed_annotation_file_path):
             logger.info(f"Already preprocessed {dataset_name}")
             return
+
+        # The checkpoint is shared by all runs, so only one run at a time may write it
+        with open(preprocessed_annotation_file_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another run may have finished preprocessing while this one waited for the lock
+            if exists(preprocessed_annotation_file_path):
+                logger.info(f"Already preprocessed {dataset_name}")
+                return
+            self._preprocess_locked(dataset_name)
+
+    def _preprocess_locked(self, dataset_name: str):
+        """Preprocesses the dataset, see `preprocess`. Expects the caller to hold the preprocessing lock"""
+        annotation_file_path = join(self.data_path, dataset_name, "annotations_elements.json")
+        preprocessed_annotation_file_path = join(self.data_path, dataset_name, self.preprocessed_annotation_file_name)
+        checkpoint_file_path = preprocessed_annotation_file_path + ".checkpoint"
+        xls_dir_path = join(self.data_path, dataset_name, "xls")
         logger.info(f"Working on {dataset_name}")
 
         with open(annotation_file_path) as f:
             annotations = json.load(f)
-        new_annotations = {}
 
-        for key in tqdm(annotations.keys()):
-            xls_file_name, sheet_name = DataPreprocessor.split_annotation_key(key)
+        # Group keys by their xls file
+        keys_per_xls_file: Dict[str, List[str]] = {}
+        for key in annotations.keys():
+            xls_file_name, _ = DataPreprocessor.split_annotation_key(key)
+            keys_per_xls_file.setdefault(xls_file_name, []).append(key)
+
+        new_annotations, processed_xls_files = DataPreprocessor.read_checkpoint(checkpoint_file_path)
+        if len(processed_xls_files) > 0:
+            logger.info(f"Resuming from checkpoint, {len(processed_xls_files)} xls files already processed")
+
+        tasks = [
+            (join(xls_dir_path, xls_file_name), dict([(key, annotations[key]) for key in keys]))
+            for xls_file_name, keys in keys_per_xls_file.items()
+            if xls_file_name not in processed_xls_files
+        ]
+        with open(checkpoint_file_path, "a") as checkpoint:
+            if self.processes == 1:
+                results = map(self.process_xls_file, tasks)
+                self._collect(results, len(tasks), new_annotations, checkpoint)
+            else:
+                with Pool(self.processes) as pool:
+                    results = pool.imap_unordered(self.process_xls_file, tasks)
+                    self._collect(results, len(tasks), new_annotations, checkpoint)
+
+        # Write new annotations to disk, in the order of the original annotations
+        new_annotations = dict([(key, new_annotations[key]) for key in annotations.keys() if key in new_annotations])
+        with open(preprocessed_annotation_file_path, "w") as f:
+            json.dump(new_annotations, f, ensure_ascii=False, indent=4)
+        remove(checkpoint_file_path)
 
-            xls_file_path = join(xls_dir_path, xls_file_name)
+    @staticmethod
+    def _collect(results: Iterable[Tuple[str, Dict]], total: int, new_annotations: Dict, checkpoint: TextIO):
+        """Gathers the results of processed xls files and appends each to the checkpoint"""
+        for xls_file_path, file_annotations in tqdm(results, total=total):
+            new_annotations.update(file_annotations)
+            checkpoint.write(json.dumps({"xls_file": basename(xls_file_path), "annotations": file_annotations}) + "\n")
+            checkpoint.flush()
 
-            # Skip if too large
-            if getsize(xls_file_path) > self.file_size_cap:
-                continue
+    @staticmethod
+    def read_checkpoint(checkpoint_file_path: str) -> Tuple[Dict, Set[str]]:
+        """Returns the annotations and the names of all xls files that were processed by an interrupted run"""
+        new_annotations = {}
+        processed_xls_files = set()
+        if not exists(checkpoint_file_path):
+            return new_annotations, processed_xls_files
+
+        valid_length = 0
+        with open(checkpoint_file_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line was not completely written when the run got interrupted
+                    break
+                new_annotations.update(entry["annotations"])
+                processed_xls_files.add(entry["xls_file"])
+                valid_length += len(line)
+        # Drop the incomplete line, so new entries are appended to a valid checkpoint
+        truncate(checkpoint_file_path, valid_length)
+        return new_annotations, processed_xls_files
+
+    def process_xls_file(self, task: Tuple[str, Dict[str, Dict]]) -> Tuple[str, Dict[str, Dict]]:
+        """Filters and rewrites the annotations of all sheets of a single xls file
+        Expects the path of the xls file and the annotations of its sheets by key"""
+        xls_file_path, sheet_annotations = task
+
+        # Skip if too large
+        if getsize(xls_file_path) > self.file_size_cap:
+            return xls_file_path, {}
+
+        # Skip sheets with hidden rows/cols before paying for a full load, if their xml can be probed directly
+        # Note:
+        # This is coherent with the authors previous publications of Koci et al.
+        # See "Table Recognition in Spreadsheets via a Graph Representation, 2018 - VI. Experimental Evaluation A"
+        contains_hidden: Dict[str, Optional[bool]] = {}
+        if self.remove_hidden:
+            for key in sheet_annotations.keys():
+                _, sheet_name = DataPreprocessor.split_annotation_key(key)
+                contains_hidden[key] = XlsxProbe.sheet_contains_hidden(xls_file_path, sheet_name)
+            sheet_annotations = dict([
+                (key, annotation) for key, annotation in sheet_annotations.items() if contains_hidden[key] is not True
+            ])
+            if len(sheet_annotations) == 0:
+                return xls_file_path, {}
+
+        # Skip if not loadable
+        try:
+            wb = load_workbook(xls_file_path)
+        except Exception as e:
+            # Explicit catch all, as we dont know what can gpo wrong with loading a workbook
+            # Does not catch KeyboardInterrupt and SystemExit
+            # Something went wrong with loading the workbook, log and skip
+            logger.warning(f"Could not load workbook {xls_file_path}")
+            return xls_file_path, {}
 
-            # Skip if not loadable
-            try:
-                wb = load_workbook(xls_file_path)
-            except Exception as e:
-                # Explicit catch all, as we dont know what can gpo wrong with loading a workbook
-                # Does not catch KeyboardInterrupt and SystemExit
-                # Something went wrong with loading the workbook, log and skip
-                logger.warning(f"Could not load workbook {xls_file_path}")
-                continue
+        new_annotations = {}
+        for key, annotation in sheet_annotations.items():
+            _, sheet_name = DataPreprocessor.split_annotation_key(key)
 
-            # Skip is sheet contains hidden rows/cols
-            # Note:
-            # This is coherent with the authors previous publications of Koci et al.
-            # See "Table Recognition in Spreadsheets via a Graph Representation, 2018 - VI. Experimental Evaluation A"
+            # Skip is sheet contains hidden rows/cols, check with openpyxl if the sheet was not probed or the probe was
+            # not conclusive
             ws = wb[sheet_name]
-            if DataPreprocessor.worksheet_contains_hidden(ws):
+            if contains_hidden.get(key, None) is None and DataPreprocessor.worksheet_contains_hidden(ws):
                 continue
 
             # Add annotation
-            new_annotations[key] = self.filter_and_rewrite_annotation(annotations[key])
-        # Write new annotations to disk
-        with open(preprocessed_annotation_file_path, "w") as f:
-            json.dump(new_annotations, f, ensure_ascii=False, indent=4)
+            new_annotations[key] = self.filter_and_rewrite_annotation(annotation)
+        return xls_file_path, new_annotations
 
     @staticmethod
     def worksheet_contains_hidden(worksheet: Worksheet):
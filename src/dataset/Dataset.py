@@ -4,12 +4,16 @@ import json
 import logging
 from functools import cached_property
 from os.path import join
-from typing import Generator, List
+from typing import Generator, List, Optional
 
 from openpyxl import load_workbook
+from tqdm import tqdm
 
 from dataset.DataPreprocessor import DataPreprocessor
 from dataset.SheetData import SheetData
+from dataset.SheetFeatureCache import SheetFeatureCache
+from dataset.SheetFeatures import SheetFeatures
+from dataset.SheetGeometry import SheetGeometry
 from labelregions.LabelRegionLoader import LabelRegionLoader
 
 logger = logging.getLogger(__name__)
@@ -22,10 +26,20 @@ class Dataset(object):
             name,
             # Uses preprocessed annotation elements per default. Parameterize with annotations_elements.json to use raw
             annotations_file_name="preprocessed_annotations_elements.json",
+            # Directory within the dataset path to cache extracted sheet features in. Set to None to always read the xls
+            feature_cache_dir_name: Optional[str] = "feature_cache",
     ):
         self.path = path
         self.name = name
         self.annotations_file_name = annotations_file_name
+        self.feature_cache_dir_name = feature_cache_dir_name
+
+    @cached_property
+    def _feature_cache(self) -> Optional[SheetFeatureCache]:
+        """The feature cache of this dataset, None if caching is disabled"""
+        if self.feature_cache_dir_name is None:
+            return None
+        return SheetFeatureCache(join(self.path, self.feature_cache_dir_name))
 
     @cached_property
     def _annotations(self):
@@ -70,23 +84,92 @@ class Dataset(object):
                 continue
             yield self.get_specific_sheetdata(key, label_region_loader)
 
+    def _xls_file_path(self, key: str) -> str:
+        """Returns the path to the xls file of the given file key"""
+        xls_file_name, _ = DataPreprocessor.split_annotation_key(key)
+        return join(self.path, "xls", xls_file_name)
+
+    def build_feature_cache(self):
+        """Fills the feature cache for all keys. Loads every stale xls file only once for all its sheets"""
+        if self._feature_cache is None:
+            return
+
+        keys_per_xls_file = {}
+        for key in self._annotations.keys():
+            keys_per_xls_file.setdefault(self._xls_file_path(key), []).append(key)
+
+        for xls_file_path, keys in tqdm(keys_per_xls_file.items(), desc=f"Building feature cache of {self.name}"):
+            stale_keys = [
+                key for key in keys
+                if self._feature_cache.lookup(key, xls_file_path, self._annotations[key]) is None
+            ]
+            if len(stale_keys) == 0:
+                continue
+            wb = load_workbook(xls_file_path)
+            for key in stale_keys:
+                _, sheet_name = DataPreprocessor.split_annotation_key(key)
+                self._feature_cache.store(key, xls_file_path, self._annotations[key], wb[sheet_name])
+
+    def get_sheet_features(self, key: str) -> SheetFeatures:
+        """Return the cached features of the given file key, extracts them if they are not cached yet"""
+        xls_file_path = self._xls_file_path(key)
+        sheet_annotations = self._annotations[key]
+        features = self._feature_cache.lookup(key, xls_file_path, sheet_annotations)
+        if features is None:
+            _, sheet_name = DataPreprocessor.split_annotation_key(key)
+            wb = load_workbook(xls_file_path)
+            features = self._feature_cache.store(key, xls_file_path, sheet_annotations, wb[sheet_name])
+        return features
+
     def get_specific_sheetdata(self, key: str, label_region_loader: LabelRegionLoader) -> SheetData:
         """Return sheet data object of the given file key, loaded with the given label region loader"""
+        sheet_annotations = self._annotations[key]
+        if self._feature_cache is not None:
+            features = self.get_sheet_features(key)
+            label_regions, table_definitions = (
+                label_region_loader.load_label_regions_and_table_definitions_from_features(features, sheet_annotations)
+            )
+            return SheetData(features.geometry, label_regions, table_definitions)
+
         # Load the xls
-        xls_file_name, sheet_name = DataPreprocessor.split_annotation_key(key)
-        xls_file_path = join(self.path, "xls", xls_file_name)
+        _, sheet_name = DataPreprocessor.split_annotation_key(key)
+        xls_file_path = self._xls_file_path(key)
         wb = load_workbook(xls_file_path)
-        wb.path = xls_file_path  # Path is wrongly defaulted to /xl/workbook.xml, change it
         ws = wb[sheet_name]
 
         # Load the annotations
-        sheet_annotations = self._annotations[key]
         label_regions, table_definitions = label_region_loader.load_label_regions_and_table_definitions(
             ws,
             sheet_annotations,
         )
         # Create & return the sheetdata
-        return SheetData(ws, label_regions, table_definitions)
+        return SheetData(SheetGeometry.from_worksheet(ws, xls_file_path), label_regions, table_definitions)
+
+    def get_noisy_sheetdata_variants(
+            self,
+            key: str,
+            label_region_loader: LabelRegionLoader,
+            seeds: List[int],
+    ) -> List[SheetData]:
+        """Return one sheet data object per seed, each with independently noised label regions.
+        The sheet is loaded only once for all variants, see `load_noisy_label_region_variants_from_mask`"""
+        sheet_annotations = self._annotations[key]
+        if self._feature_cache is not None:
+            features = self.get_sheet_features(key)
+            geometry, non_empty_mask = features.geometry, features.non_empty_mask
+        else:
+            _, sheet_name = DataPreprocessor.split_annotation_key(key)
+            xls_file_path = self._xls_file_path(key)
+            ws = load_workbook(xls_file_path)[sheet_name]
+            geometry = SheetGeometry.from_worksheet(ws, xls_file_path)
+            non_empty_mask = LabelRegionLoader.occupancy_grid(ws)
+
+        variants, table_definitions = label_region_loader.load_noisy_label_region_variants_from_mask(
+            non_empty_mask,
+            sheet_annotations,
+            seeds,
+        )
+        return [SheetData(geometry, label_regions, table_definitions) for label_regions in variants]
 
     def __str__(self):
         """Dataset String Representation"""
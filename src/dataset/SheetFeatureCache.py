@@ -0,0 +1,172 @@
+"""On-disk cache of sheet features, so each workbook is parsed once per dataset instead of once per load"""
+import json
+import logging
+import os
+from hashlib import sha1
+from os.path import join, exists, getsize, getmtime
+from typing import Dict, Optional
+
+import numpy as np
+from openpyxl.worksheet.worksheet import Worksheet
+
+from dataset.SheetFeatures import SheetFeatures
+from dataset.SheetGeometry import SheetGeometry
+from labelregions.BoundingBox import BoundingBox
+from labelregions.LabelRegion import LabelRegion
+from labelregions.LabelRegionLoader import LabelRegionLoader
+from labelregions.LabelRegionType import LabelRegionType
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the extraction or the storage layout changes, invalidates all entries
+CACHE_VERSION = 2
+
+LABEL_REGION_TYPES = list(LabelRegionType)
+
+
+def file_hash(path: str) -> str:
+    """Returns the sha1 hex digest of a file's content"""
+    h = sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def annotation_hash(sheet_annotations: Dict) -> str:
+    """Returns a hash of the annotations of a single sheet"""
+    return sha1(json.dumps(sheet_annotations, sort_keys=True).encode()).hexdigest()
+
+
+class SheetFeatureCache(object):
+    """Stores one compressed numpy archive per annotation key. An entry is valid as long as
+    the annotations of its key and the content of its xls file did not change. The file's size and mtime
+    are checked first, the content hash is only recalculated if they differ"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        """Returns the path of the archive for the given annotation key"""
+        return join(self.path, sha1(key.encode()).hexdigest() + ".npz")
+
+    def lookup(self, key: str, xls_file_path: str, sheet_annotations: Dict) -> Optional[SheetFeatures]:
+        """Returns the cached features of the given key, or None if there is no valid entry"""
+        entry_path = self._entry_path(key)
+        if not exists(entry_path):
+            return None
+        try:
+            with np.load(entry_path, allow_pickle=False) as archive:
+                entry = dict(archive.items())
+        except (OSError, ValueError, KeyError):
+            logger.warning(f"Dropping unreadable feature cache entry of {key}")
+            return None
+
+        if int(entry["version"]) != CACHE_VERSION:
+            return None
+        if str(entry["annotation_hash"]) != annotation_hash(sheet_annotations):
+            return None
+
+        size, mtime = getsize(xls_file_path), getmtime(xls_file_path)
+        if int(entry["xls_size"]) != size or float(entry["xls_mtime"]) != mtime:
+            # File was touched, check whether the content changed
+            if str(entry["xls_hash"]) != file_hash(xls_file_path):
+                return None
+            entry["xls_size"], entry["xls_mtime"] = np.array(size), np.array(mtime)
+            self._write(entry_path, entry)
+
+        return SheetFeatureCache._features_from_entry(entry, xls_file_path)
+
+    def store(self, key: str, xls_file_path: str, sheet_annotations: Dict, worksheet: Worksheet) -> SheetFeatures:
+        """Extracts the features of the given worksheet, writes them to the cache and returns them"""
+        non_empty_mask = LabelRegionLoader.occupancy_grid(worksheet)
+        label_regions, table_definitions = LabelRegionLoader().load_label_regions_and_table_definitions_from_mask(
+            non_empty_mask,
+            sheet_annotations,
+        )
+        features = SheetFeatures(
+            SheetGeometry.from_worksheet(worksheet, xls_file_path),
+            non_empty_mask,
+            label_regions,
+            table_definitions,
+        )
+
+        entry = SheetFeatureCache._entry_from_features(features)
+        entry.update({
+            "version": np.array(CACHE_VERSION),
+            "annotation_hash": np.array(annotation_hash(sheet_annotations)),
+            "xls_hash": np.array(file_hash(xls_file_path)),
+            "xls_size": np.array(getsize(xls_file_path)),
+            "xls_mtime": np.array(getmtime(xls_file_path)),
+        })
+        self._write(self._entry_path(key), entry)
+        return features
+
+    @staticmethod
+    def _write(entry_path: str, entry: Dict[str, np.ndarray]):
+        """Writes an entry atomically, so concurrent runs never read half written archives"""
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **entry)
+        os.replace(tmp_path, entry_path)
+
+    @staticmethod
+    def _entry_from_features(features: SheetFeatures) -> Dict[str, np.ndarray]:
+        """Packs features into flat arrays"""
+        geometry = features.geometry
+        label_regions = np.array(
+            [
+                [lr.id, LABEL_REGION_TYPES.index(lr.type), lr.top, lr.left, lr.bottom, lr.right]
+                for lr in features.label_regions
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 6)
+        table_definitions = np.array(
+            [[td.top, td.left, td.bottom, td.right] for td in features.table_definitions],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+        return {
+            "title": np.array(geometry.title),
+            "column_widths": np.array(geometry.column_widths, dtype=np.float64),
+            "row_heights": np.array(geometry.row_heights, dtype=np.float64),
+            "default_dimensions": np.array(
+                [geometry.default_column_width, geometry.default_row_height],
+                dtype=np.float64,
+            ),
+            "non_empty_shape": np.array(features.non_empty_mask.shape, dtype=np.int64),
+            "non_empty_bits": np.packbits(features.non_empty_mask, axis=None),
+            "label_regions": label_regions,
+            "table_definitions": table_definitions,
+        }
+
+    @staticmethod
+    def _features_from_entry(entry: Dict[str, np.ndarray], xls_file_path: str) -> SheetFeatures:
+        """Unpacks features from flat arrays"""
+        default_column_width, default_row_height = entry["default_dimensions"].tolist()
+        geometry = SheetGeometry(
+            str(entry["title"]),
+            xls_file_path,
+            entry["column_widths"].tolist(),
+            entry["row_heights"].tolist(),
+            default_column_width,
+            default_row_height,
+        )
+
+        height, width = entry["non_empty_shape"].tolist()
+        non_empty_mask = np.unpackbits(entry["non_empty_bits"], count=height * width).astype(bool)
+
+        label_regions = [
+            LabelRegion(lr_id, LABEL_REGION_TYPES[lr_type], top, left, bottom, right)
+            for lr_id, lr_type, top, left, bottom, right in entry["label_regions"].tolist()
+        ]
+        table_definitions = [
+            BoundingBox(top, left, bottom, right)
+            for top, left, bottom, right in entry["table_definitions"].tolist()
+        ]
+        return SheetFeatures(
+            geometry,
+            non_empty_mask.reshape(height, width),
+            label_regions,
+            table_definitions,
+        )
@@ -0,0 +1,27 @@
+"""Everything extracted from a single annotated worksheet, so its workbook does not have to be opened again"""
+from typing import List
+
+import numpy as np
+
+from dataset.SheetGeometry import SheetGeometry
+from labelregions.BoundingBox import BoundingBox
+from labelregions.LabelRegion import LabelRegion
+
+
+class SheetFeatures(object):
+    def __init__(
+            self,
+            geometry: SheetGeometry,
+            non_empty_mask: np.ndarray,
+            label_regions: List[LabelRegion],
+            table_definitions: List[BoundingBox],
+    ):
+        self.geometry = geometry
+        # Boolean [y, x] occupancy grid of the sheet's used range, coords start at zero
+        self.non_empty_mask = non_empty_mask
+        # Label regions and table definitions as created by a LabelRegionLoader with default settings
+        self.label_regions = label_regions
+        self.table_definitions = table_definitions
+
+    def __str__(self):
+        return f"SheetFeatures({self.geometry.title} of {self.geometry.path})"
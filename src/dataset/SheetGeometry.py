@@ -0,0 +1,186 @@
+"""Column widths and row heights of a single worksheet, detached from openpyxl"""
+from hashlib import sha1
+from typing import Sequence
+
+import numpy as np
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.worksheet.dimensions import ColumnDimension
+from openpyxl.worksheet.worksheet import Worksheet
+
+
+class SheetGeometry(object):
+    """Immutable and cheap to pickle replacement for the parts of a worksheet the metrics need"""
+    __slots__ = ("_title", "_path", "_column_widths", "_row_heights", "_default_column_width", "_default_row_height",
+                 "_column_width_prefix", "_row_height_prefix", "_id")
+
+    def __init__(
+            self,
+            title: str,
+            path: str,
+            column_widths: Sequence[float],
+            row_heights: Sequence[float],
+            default_column_width: float,
+            default_row_height: float,
+    ):
+        self._title = title
+        self._path = path
+        # Index 0 refers to column 1 / row 1, indices past the end use the defaults
+        self._column_widths = SheetGeometry._read_only_array(column_widths)
+        self._row_heights = SheetGeometry._read_only_array(row_heights)
+        self._default_column_width = float(default_column_width)
+        self._default_row_height = float(default_row_height)
+        # Prefix sums, index i holds the total size of the first i columns/rows
+        self._column_width_prefix = SheetGeometry._prefix_sums(self._column_widths)
+        self._row_height_prefix = SheetGeometry._prefix_sums(self._row_heights)
+
+        h = sha1()
+        h.update(f"{self._path}\0{self._title}\0{self._default_column_width}\0{self._default_row_height}".encode())
+        h.update(self._column_widths.tobytes())
+        h.update(b"\0")
+        h.update(self._row_heights.tobytes())
+        self._id = h.hexdigest()
+
+    @staticmethod
+    def _read_only_array(values: Sequence[float]) -> np.ndarray:
+        array = np.array(values, dtype=np.float64)
+        array.setflags(write=False)
+        return array
+
+    @staticmethod
+    def _prefix_sums(values: np.ndarray) -> np.ndarray:
+        prefix = np.zeros(len(values) + 1, dtype=np.float64)
+        np.cumsum(values, out=prefix[1:])
+        prefix.setflags(write=False)
+        return prefix
+
+    @staticmethod
+    def _span_sums(prefix: np.ndarray, default: float, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """Sums sizes from starts to stops (inclusive, starting at 1) as prefix sum differences.
+        Indices past the stored sizes use the default"""
+        known = len(prefix) - 1
+
+        def total_up_to(indices: np.ndarray) -> np.ndarray:
+            indices = np.maximum(np.asarray(indices, dtype=np.int64), 0)
+            return prefix[np.minimum(indices, known)] + np.maximum(indices - known, 0) * default
+
+        return total_up_to(stops) - total_up_to(np.asarray(starts, dtype=np.int64) - 1)
+
+    @property
+    def title(self) -> str:
+        return self._title
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def column_widths(self) -> np.ndarray:
+        return self._column_widths
+
+    @property
+    def row_heights(self) -> np.ndarray:
+        return self._row_heights
+
+    @property
+    def default_column_width(self) -> float:
+        return self._default_column_width
+
+    @property
+    def default_row_height(self) -> float:
+        return self._default_row_height
+
+    @property
+    def id(self) -> str:
+        """Identity hash of the sheet, covers its location and all dimensions"""
+        return self._id
+
+    def column_width(self, col_idx: int) -> float:
+        """Returns the width of the given column index, openpyxl indexing (starting at 1)"""
+        if 1 <= col_idx <= len(self._column_widths):
+            return float(self._column_widths[col_idx - 1])
+        return self._default_column_width
+
+    def row_height(self, row_idx: int) -> float:
+        """Returns the height of the given row index, openpyxl indexing (starting at 1)"""
+        if 1 <= row_idx <= len(self._row_heights):
+            return float(self._row_heights[row_idx - 1])
+        return self._default_row_height
+
+    def column_span_widths(self, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """Returns the total width of each column span starts to stops (inclusive), openpyxl indexing"""
+        return SheetGeometry._span_sums(self._column_width_prefix, self._default_column_width, starts, stops)
+
+    def row_span_heights(self, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """Returns the total height of each row span starts to stops (inclusive), openpyxl indexing"""
+        return SheetGeometry._span_sums(self._row_height_prefix, self._default_row_height, starts, stops)
+
+    @staticmethod
+    def from_worksheet(worksheet: Worksheet, path: str):
+        """Extracts the geometry of a worksheet. Resolves dimensions the same way a lookup on
+        `column_dimensions`/`row_dimensions` with a fallback to the `sheet_format` defaults would"""
+        sheet_format = worksheet.sheet_format
+
+        # Columns without an explicit dimension get a fresh ColumnDimension on lookup, use its width
+        default_column_width = ColumnDimension(worksheet).width
+        if default_column_width is None:
+            default_column_width = sheet_format.defaultColWidth
+        default_row_height = sheet_format.defaultRowHeight
+
+        # Only read existing dimensions, a lookup would create new entries
+        column_dimensions = dict(worksheet.column_dimensions.items())
+        row_dimensions = dict(worksheet.row_dimensions.items())
+
+        column_count = max([worksheet.max_column] + [
+            column_index_from_string(column_letter) for column_letter in column_dimensions.keys()
+        ])
+        column_widths = []
+        for col_idx in range(1, column_count + 1):
+            dimension = column_dimensions.get(get_column_letter(col_idx), None)
+            if dimension is None:
+                width = default_column_width
+            else:
+                width = dimension.width
+                if width is None:
+                    # Dimensions are None if default values are used
+                    width = sheet_format.defaultColWidth
+            column_widths.append(width)
+
+        row_count = max([worksheet.max_row] + list(row_dimensions.keys()))
+        row_heights = []
+        for row_idx in range(1, row_count + 1):
+            dimension = row_dimensions.get(row_idx, None)
+            height = None if dimension is None else dimension.height
+            if height is None:
+                # Dimensions are None if default values are used
+                height = default_row_height
+            row_heights.append(height)
+
+        return SheetGeometry(
+            worksheet.title,
+            path,
+            column_widths,
+            row_heights,
+            default_column_width,
+            default_row_height,
+        )
+
+    def __getstate__(self):
+        return self._title, self._path, self._column_widths, self._row_heights, self._default_column_width, \
+               self._default_row_height
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __setattr__(self, key, value):
+        if hasattr(self, "_id"):
+            raise AttributeError("SheetGeometry is immutable")
+        super().__setattr__(key, value)
+
+    def __eq__(self, other):
+        return isinstance(other, SheetGeometry) and self._id == other._id
+
+    def __hash__(self):
+        return hash(self._id)
+
+    def __str__(self):
+        return f"SheetGeometry({self.title} of {self.path})"
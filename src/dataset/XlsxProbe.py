@@ -0,0 +1,84 @@
+"""Reads single properties of xlsx files straight from their xml, without loading the workbook with openpyxl"""
+import logging
+import posixpath
+import zipfile
+from typing import Optional, Dict
+from xml.etree.ElementTree import iterparse, fromstring, ParseError
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ("1", "true")
+
+
+def _local_name(tag: str) -> str:
+    """Strips the namespace of a tag or attribute, so transitional and strict xlsx files are handled alike"""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _relationship_targets(archive: zipfile.ZipFile, part_path: str) -> Dict[str, str]:
+    """Returns all relationship ids of a part mapped to the absolute paths of their targets within the archive"""
+    part_dir, part_name = posixpath.split(part_path)
+    rels_path = posixpath.join(part_dir, "_rels", part_name + ".rels")
+    targets = {}
+    for relationship in fromstring(archive.read(rels_path)):
+        target = relationship.get("Target", "")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(part_dir, target))
+        targets[relationship.get("Id")] = target
+    return targets
+
+
+def _workbook_path(archive: zipfile.ZipFile) -> str:
+    """Returns the path of the workbook part, as referenced by the package relationships"""
+    for relationship in fromstring(archive.read("_rels/.rels")):
+        if relationship.get("Type", "").endswith("/officeDocument"):
+            return relationship.get("Target").lstrip("/")
+    return "xl/workbook.xml"
+
+
+def _sheet_path(archive: zipfile.ZipFile, sheet_name: str) -> Optional[str]:
+    """Returns the path of the xml part of the given sheet, None if there is no such sheet"""
+    workbook_path = _workbook_path(archive)
+    for element in fromstring(archive.read(workbook_path)).iter():
+        if _local_name(element.tag) != "sheet" or element.get("name") != sheet_name:
+            continue
+        relationship_ids = [value for key, value in element.attrib.items() if key.startswith("{")
+                            and _local_name(key) == "id"]
+        if len(relationship_ids) == 0:
+            return None
+        return _relationship_targets(archive, workbook_path).get(relationship_ids[0], None)
+    return None
+
+
+def sheet_contains_hidden(xls_file_path: str, sheet_name: str) -> Optional[bool]:
+    """Whether a sheet of a xlsx file contains hidden rows or columns.
+    Stream-parses only the xml of that sheet and stops at the first hidden row/col.
+    Returns None if the file can not be probed this way (not a xlsx file, unexpected structure),
+    the caller has to fall back to loading the workbook in that case"""
+    try:
+        with zipfile.ZipFile(xls_file_path) as archive:
+            sheet_path = _sheet_path(archive, sheet_name)
+            if sheet_path is None:
+                return None
+            with archive.open(sheet_path) as sheet_xml:
+                sheet_data = None
+                for event, element in iterparse(sheet_xml, events=("start", "end")):
+                    tag = _local_name(element.tag)
+                    if event == "start":
+                        if tag in ("col", "row") and element.get("hidden", "").lower() in TRUE_VALUES:
+                            return True
+                        if tag == "sheetData":
+                            sheet_data = element
+                        continue
+                    if tag == "sheetData":
+                        # Column definitions precede the sheet data and all rows are within it
+                        return False
+                    if tag == "row" and sheet_data is not None:
+                        # Finished rows and their cells are not needed, free them while streaming
+                        sheet_data.clear()
+                return False
+    except (zipfile.BadZipFile, KeyError, ParseError, OSError) as e:
+        logger.debug(f"Could not probe {xls_file_path} for hidden rows/cols: {e}")
+        return None
@@ -7,8 +7,9 @@ import uuid
 from os import makedirs
 from os.path import join
 from random import choice, shuffle, seed
-from typing import List, Dict, Union, Callable
+from typing import List, Dict, Union, Callable, Tuple, Optional
 
+import numpy as np
 from numpy import array_split
 from scipy.optimize import minimize, Bounds
 from tqdm import tqdm
@@ -23,6 +24,8 @@ from search.ExhaustiveSearch import ExhaustiveSearch
 from search.FitnessRater import FitnessRater, get_initial_weights
 from search.GeneticSearch import GeneticSearch
 from search.GeneticSearchConfiguration import GeneticSearchConfiguration
+from search.MetricStore import MetricStore
+from search.SubsetDPSearch import SubsetDPSearch
 
 
 class CrossValidationTraining(object):
@@ -37,10 +40,13 @@ class CrossValidationTraining(object):
             search_rounds=10,
             random_seed=1,
             edge_mutation_probability_callback: Callable[[Edge], int] = lambda x: 1,
+            # Persistent store of metric values shared by all raters of this and other runs, None to disable
+            metric_store: Optional[MetricStore] = None,
     ):
         seed(random_seed)
         self._dataset = dataset
         self._label_region_loader = label_region_loader
+        self._metric_store = metric_store
 
         # Create a unique output dir
         run_id = uuid.uuid1().hex
@@ -74,6 +80,8 @@ class CrossValidationTraining(object):
         fold_accuracies = []
         for fold_num_and_fold in tqdm(enumerate(folds)):
             fold_accuracies.append(self.process_fold(fold_num_and_fold[1], fold_num_and_fold[0]))
+            if self._metric_store is not None:
+                self._metric_store.flush()
 
         self.dump(
             "final_accuracy.json",
@@ -130,11 +138,14 @@ class CrossValidationTraining(object):
             ground_truth = sheet_graph.get_table_definitions()
 
             # Evaluate the prediction
-            rater = FitnessRater(weights)
+            rater = FitnessRater(weights, metric_store=self._metric_store)
             if len(sheet_graph.nodes) <= 10:
                 accuracy = CrossValidationTraining.exhaustive_search_accuracy(ground_truth, sheet_graph, rater)
+            elif len(sheet_graph.nodes) <= 20:
+                accuracy = CrossValidationTraining.subset_dp_search_accuracy(ground_truth, sheet_graph, rater)
             else:
                 accuracy = self.genetic_search_accuracy(ground_truth, sheet_graph, rater)
+            rater.release(sheet_graph)
             file_accuracies[key] = accuracy
 
         # Average fold accuracies of test data
@@ -147,26 +158,76 @@ class CrossValidationTraining(object):
         return fold_accuracy
 
     @staticmethod
-    def objective_function(weights: List[float], partitions: Dict[SpreadSheetGraph, List[List[bool]]],
-                           rater: FitnessRater):
-        """Objective function proposed by the paper used by the sqp optimizer"""
-        # Update the weights
-        rater.weights = weights
-        # Calculate the score by summing target partition over alternative partitions scores
-        score = 0
+    def extract_features(partitions: Dict[SpreadSheetGraph, List[List[bool]]], rater: FitnessRater) -> \
+            Tuple[np.ndarray, np.ndarray]:
+        """Returns the [pair, feature] matrices of the target and the alternative partition of every target &
+        alternative pair. Ratings are linear in the weights, so the features are extracted once for all weights"""
+        target_features, alternative_features = [], []
         for graph, alternative_toggle_lists in partitions.items():
-            target_partition_part = 1 + rater.rate(graph, graph.edge_toggle_list)
+            target_partition_features = rater.partition_features(graph.target_partition)
             for alternative_toggle_list in alternative_toggle_lists:
-                alternative_partition_part = 1 + rater.rate(graph, alternative_toggle_list)
-                score += target_partition_part / alternative_partition_part
-        return score
+                target_features.append(target_partition_features)
+                alternative_features.append(rater.partition_features(graph.partition(alternative_toggle_list)))
+        feature_count = rater.correct_weight_length()
+        return (
+            np.array(target_features, dtype=np.float64).reshape(-1, feature_count),
+            np.array(alternative_features, dtype=np.float64).reshape(-1, feature_count),
+        )
+
+    @staticmethod
+    def objective_function(weights: np.ndarray, target_features: np.ndarray, alternative_features: np.ndarray):
+        """Objective function proposed by the paper used by the sqp optimizer.
+        Sums the target partition score over the alternative partition score of every pair"""
+        target_partition_parts = 1 + target_features @ weights
+        alternative_partition_parts = 1 + alternative_features @ weights
+        return float(np.sum(target_partition_parts / alternative_partition_parts))
+
+    @staticmethod
+    def objective_gradient(weights: np.ndarray, target_features: np.ndarray, alternative_features: np.ndarray):
+        """Exact gradient of the objective function in regard of the weights"""
+        target_partition_parts = 1 + target_features @ weights
+        alternative_partition_parts = 1 + alternative_features @ weights
+        return (
+                target_features.T @ (1 / alternative_partition_parts)
+                - alternative_features.T @ (target_partition_parts / alternative_partition_parts ** 2)
+        )
+
+    @staticmethod
+    def fit_weights(
+            partitions: Dict[SpreadSheetGraph, List[List[bool]]],
+            rater: FitnessRater,
+            initial_weights: List[float],
+    ) -> Tuple[List[float], int, int]:
+        """Performs SQP on the given partitions. Returns the resulting weights, the total number of alternatives
+        and the number of alternatives that are rated better than their target partition"""
+        target_features, alternative_features = CrossValidationTraining.extract_features(partitions, rater)
+        # The features are all the optimizer needs, the cached scores of the graphs are not used anymore
+        for graph in partitions.keys():
+            rater.release(graph)
+
+        # Use SQP to minimize the obj. function
+        res = minimize(
+            CrossValidationTraining.objective_function,
+            np.array(initial_weights, dtype=np.float64),
+            args=(target_features, alternative_features),
+            jac=CrossValidationTraining.objective_gradient,
+            method="SLSQP",
+            bounds=Bounds(0, 1000),
+        )
+
+        weights = list(res.x)
+        # Calculate error rate components
+        better_than_original_alternative_count = int(np.count_nonzero(
+            alternative_features @ res.x < target_features @ res.x
+        ))
+        return weights, len(alternative_features), better_than_original_alternative_count
 
     @staticmethod
     def generate_alternatives(graph: SpreadSheetGraph, n=1) -> List[List[bool]]:
         """Generates n random edge toggle lists for the given graph"""
         alternatives = []
         for _ in range(n):
-            alternatives.append([choice([True, False]) for _ in range(len(graph.edge_toggle_list))])
+            alternatives.append([choice([True, False]) for _ in range(len(graph.edge_list))])
         return alternatives
 
     def train(self, train_keys: List[str], fold_num: int, training_round: int) -> Dict[str, Union[List[float], float]]:
@@ -189,33 +250,11 @@ class CrossValidationTraining(object):
 
         initial_weights = get_initial_weights()
         # Create rater object outside to leverage caching
-        rater = FitnessRater(initial_weights)
-
-        # Use SQP to minimize the obj. function
-        res = minimize(
-            CrossValidationTraining.objective_function,
-            initial_weights,
-            args=(partitions, rater),
-            method="SLSQP",
-            bounds=Bounds(0, 1000),
+        rater = FitnessRater(initial_weights, metric_store=self._metric_store)
+        weights, total_alternative_count, better_than_original_alternative_count = (
+            CrossValidationTraining.fit_weights(partitions, rater, initial_weights)
         )
 
-        weights = list(res.x)
-        rater.weights = weights
-
-        # Calculate error rate components
-        total_alternative_count = 0
-        better_than_original_alternative_count = 0
-        for graph, alternatives in partitions.items():
-            obj_score_original_graph = rater.rate(graph, graph.edge_toggle_list)
-
-            total_alternative_count += len(alternatives)
-            better_than_original_alternative_count += len([
-                alternative
-                for alternative in alternatives
-                if rater.rate(graph, alternative) < obj_score_original_graph
-            ])
-
         self.dump(
             f"fold_{fold_num}_training_round_{training_round}_result.json",
             {
@@ -242,6 +281,20 @@ class CrossValidationTraining(object):
         result = search.run()
         return Analyser.accuracy_based_on_jacard_index(ground_truth, result.get_table_definitions())
 
+    @staticmethod
+    def subset_dp_search_accuracy(
+            ground_truth: List[BoundingBox],
+            sheet_graph: SpreadSheetGraph,
+            rater: FitnessRater,
+    ):
+        """Runs a subset dp search, evaluates the result against the ground truth, and returns the accuracy score"""
+        search = SubsetDPSearch(
+            sheet_graph,
+            rater,
+        )
+        result = search.run()
+        return Analyser.accuracy_based_on_jacard_index(ground_truth, result.get_table_definitions())
+
     def genetic_search_accuracy(
             self,
             ground_truth: List[BoundingBox],
@@ -4,7 +4,6 @@ import logging
 from itertools import chain
 from os.path import join, exists
 
-from openpyxl.utils import get_column_letter
 from tqdm import tqdm
 
 from dataset.Dataset import Dataset
@@ -37,7 +36,7 @@ def refine(dataset: Dataset):
 def refine_sheet_data(sheet_data: SheetData):
     """Returns metadata for a sheetdata object"""
     graph = SpreadSheetGraph(sheet_data)
-    edge_count = len(graph.edge_toggle_list)
+    edge_count = len(graph.edge_list)
 
     components = [GraphComponentData(c, graph) for c in graph.get_components()]
 
@@ -92,8 +91,4 @@ def get_empty_columns_inside_of_tables(components):
 
 def width_of_col(col_idx, graph):
     """Returns the width of the given column index for the given graph"""
-    width = graph.sheet.column_dimensions[get_column_letter(col_idx)].width
-    if width is None:
-        # Dimensions are None if default values are used
-        width = graph.sheet.sheet_format.defaultColWidth
-    return width
+    return graph.geometry.column_width(col_idx)
@@ -6,7 +6,6 @@ from os.path import join
 from statistics import median
 from typing import List, Dict, Union
 
-from scipy.optimize import minimize, Bounds
 from tqdm import tqdm
 
 from experiments.CrossValidationTraining import CrossValidationTraining
@@ -54,11 +53,14 @@ class ImprovedCrossValidationTraining(CrossValidationTraining):
             ground_truth = sheet_graph.get_table_definitions()
 
             # Evaluate the prediction
-            rater = ImprovedFitnessRater(weights, degree_avg_cut)
+            rater = ImprovedFitnessRater(weights, degree_avg_cut, metric_store=self._metric_store)
             if len(sheet_graph.nodes) <= 10:
                 accuracy = CrossValidationTraining.exhaustive_search_accuracy(ground_truth, sheet_graph, rater)
+            elif len(sheet_graph.nodes) <= 20:
+                accuracy = CrossValidationTraining.subset_dp_search_accuracy(ground_truth, sheet_graph, rater)
             else:
                 accuracy = self.genetic_search_accuracy(ground_truth, sheet_graph, rater)
+            rater.release(sheet_graph)
             file_accuracies[key] = accuracy
 
         fold_accuracy = sum(file_accuracies.values()) / len(file_accuracies.values())
@@ -89,29 +91,11 @@ class ImprovedCrossValidationTraining(CrossValidationTraining):
         initial_weights = get_initial_weights() + [1]  # Add one weights for the median avg degree cut
         degree_avg_cut = self.get_degree_avg_multi_cut(train_keys)
         # Create rater object outside to leverage caching
-        rater = ImprovedFitnessRater(initial_weights, degree_avg_cut)
-
-        res = minimize(
-            CrossValidationTraining.objective_function,
-            initial_weights,
-            args=(partitions, rater),
-            method="SLSQP",
-            bounds=Bounds(0, 1000),
-        )
+        rater = ImprovedFitnessRater(initial_weights, degree_avg_cut, metric_store=self._metric_store)
 
-        weights = list(res.x)
-        rater.weights = weights
-
-        total_alternative_count = 0
-        better_than_original_alternative_count = 0
-        for graph, alternatives in partitions.items():
-            obj_score_original_graph = rater.rate(graph, graph.edge_toggle_list)
-            total_alternative_count += len(alternatives)
-            better_than_original_alternative_count += len([
-                alternative
-                for alternative in alternatives
-                if rater.rate(graph, alternative) < obj_score_original_graph
-            ])
+        weights, total_alternative_count, better_than_original_alternative_count = (
+            CrossValidationTraining.fit_weights(partitions, rater, initial_weights)
+        )
 
         self.dump(
             f"fold_{fold_num}_training_round_{training_round}_result.json",
@@ -14,6 +14,7 @@ from search.ExhaustiveSearch import ExhaustiveSearch
 from search.FitnessRater import FitnessRater, get_initial_weights, weight_vector_length
 from search.GeneticSearch import GeneticSearch
 from search.GeneticSearchConfiguration import GeneticSearchConfiguration
+from search.SubsetDPSearch import SubsetDPSearch
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -64,14 +65,21 @@ class NoTrainingNoSeed(object):
                 sheet_graph,
                 rater,
             )
+        elif len(sheet_graph.nodes) <= 20:
+            # Up to 20 nodes, search the partitions into connected components exactly
+            search = SubsetDPSearch(
+                sheet_graph,
+                rater,
+            )
         else:
             search = GeneticSearch(
                 sheet_graph,
                 rater,
                 GeneticSearchConfiguration(sheet_graph),
             )
-        sheet_graph = search.run()
-        detected = sheet_graph.get_table_definitions()
+        partition = search.run()
+        rater.release(sheet_graph)
+        detected = partition.get_table_definitions()
 
         result = {
             "ground_truth": [bb.__dict__() for bb in ground_truth],
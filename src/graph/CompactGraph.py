@@ -0,0 +1,277 @@
+"""Array representation of a SpreadSheetGraph"""
+from functools import cached_property
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+
+from graph.Edge import Edge, AlignmentType, ConnectionType
+from labelregions.BoundingBox import BoundingBox
+from labelregions.LabelRegion import LabelRegion
+from labelregions.LabelRegionType import LabelRegionType
+
+# Codes of the enum values within the arrays, a value's code is its index
+NODE_TYPES = list(LabelRegionType)
+ALIGNMENT_TYPES = list(AlignmentType)
+CONNECTION_TYPES = list(ConnectionType)
+
+
+def span_mask(low: int, high: int) -> int:
+    """Returns a bitmask with bits low to high (inclusive) set"""
+    if high < low:
+        return 0
+    return ((1 << (high - low + 1)) - 1) << low
+
+
+def popcount(mask: int) -> int:
+    """Returns the number of set bits of a non negative bitmask"""
+    return bin(mask).count("1")
+
+
+def mask_indices(mask: int) -> List[int]:
+    """Returns the positions of all set bits of a non negative bitmask, ascending"""
+    indices = []
+    while mask:
+        lowest_bit = mask & -mask
+        indices.append(lowest_bit.bit_length() - 1)
+        mask ^= lowest_bit
+    return indices
+
+
+def mask_runs(mask: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns start and stop (inclusive) bit positions of all runs of adjacent set bits of a non negative bitmask"""
+    if mask == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    mask_bytes = np.frombuffer(mask.to_bytes((mask.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    bits = np.unpackbits(mask_bytes, bitorder="little").astype(np.int8)
+    changes = np.diff(np.concatenate([[0], bits, [0]]))
+    return np.flatnonzero(changes == 1), np.flatnonzero(changes == -1) - 1
+
+
+class CompactGraph(object):
+    """Nodes and edges of a graph as parallel numpy arrays, with CSR adjacency.
+    Node i is the i-th node and edge k is the k-th edge of the lists the compact graph was created from"""
+
+    def __init__(self, nodes: List[LabelRegion], edges: List[Edge]):
+        node_index = {node: i for i, node in enumerate(nodes)}
+        self.node_count = len(nodes)
+        self.edge_count = len(edges)
+
+        self.node_ids = np.array([node.id for node in nodes], dtype=np.int64)
+        self.node_types = np.array([NODE_TYPES.index(node.type) for node in nodes], dtype=np.int8)
+        # Columns are top, left, bottom, right, openpyxl indexing
+        self.node_bounds = np.array(
+            [[node.top, node.left, node.bottom, node.right] for node in nodes],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+
+        # Column and row coverage of each node as int bitmasks, bit i marks column/row origin + i
+        self.column_origin = int(self.node_bounds[:, 1].min()) if self.node_count > 0 else 0
+        self.row_origin = int(self.node_bounds[:, 0].min()) if self.node_count > 0 else 0
+        self.node_column_masks = [
+            span_mask(left - self.column_origin, right - self.column_origin)
+            for _, left, _, right in self.node_bounds.tolist()
+        ]
+        self.node_row_masks = [
+            span_mask(top - self.row_origin, bottom - self.row_origin)
+            for top, _, bottom, _ in self.node_bounds.tolist()
+        ]
+
+        self.edge_sources = np.array([node_index[edge.source] for edge in edges], dtype=np.int64)
+        self.edge_destinations = np.array([node_index[edge.destination] for edge in edges], dtype=np.int64)
+        self.edge_alignments = np.array([ALIGNMENT_TYPES.index(edge.alignment_type) for edge in edges], dtype=np.int8)
+        self.edge_connections = np.array(
+            [CONNECTION_TYPES.index(edge.connection_type) for edge in edges],
+            dtype=np.int8,
+        )
+        self.edge_lengths = np.array([edge.length for edge in edges], dtype=np.int64)
+        alignment_boxes = [edge.get_alignment_bounding_box() for edge in edges]
+        self.edge_alignment_bounds = np.array(
+            [[box.top, box.left, box.bottom, box.right] for box in alignment_boxes],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+
+        # CSR adjacency: the neighbours of node i and the connecting edges are at offsets[i] to offsets[i + 1],
+        # ordered by neighbour
+        ends = np.concatenate([self.edge_sources, self.edge_destinations])
+        partners = np.concatenate([self.edge_destinations, self.edge_sources])
+        edge_indices = np.concatenate([np.arange(self.edge_count)] * 2)
+        order = np.lexsort((partners, ends))
+        self.adjacency_offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ends, minlength=self.node_count), out=self.adjacency_offsets[1:])
+        self.adjacency_nodes = partners[order]
+        self.adjacency_edges = edge_indices[order]
+
+        # Union-find start of `component_labels`, copied by every call so concurrent calls do not interfere
+        self._identity = list(range(self.node_count))
+        self._edge_pairs = list(zip(self.edge_sources.tolist(), self.edge_destinations.tolist()))
+
+    def enabled_edge_indices(self, toggles: Union[Sequence[bool], np.ndarray, int]) -> List[int]:
+        """Returns the indices of all enabled edges of a toggle vector. Accepts a bool per edge,
+        or an int bitmask, in which bit k enables edge k"""
+        if isinstance(toggles, (int, np.integer)):
+            return mask_indices(int(toggles))
+        return np.flatnonzero(np.asarray(toggles, dtype=bool)).tolist()
+
+    def component_labels(self, toggles: Union[Sequence[bool], np.ndarray, int]) -> List[int]:
+        """Returns the component of each node in regard of the enabled edges of the toggle vector.
+        A component is labeled with its lowest node index. Union-find over the enabled edges"""
+        parent = list(self._identity)
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                # Path halving
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        edge_pairs = self._edge_pairs
+        for edge_index in self.enabled_edge_indices(toggles):
+            source, destination = edge_pairs[edge_index]
+            source_root, destination_root = find(source), find(destination)
+            # The lower index stays root, so roots are the lowest index of their component
+            if source_root < destination_root:
+                parent[destination_root] = source_root
+            elif destination_root < source_root:
+                parent[source_root] = destination_root
+        return [find(i) for i in range(self.node_count)]
+
+    def component_labels_batch(self, toggle_matrix: np.ndarray) -> np.ndarray:
+        """Labels the components of many toggle vectors at once, see `component_labels`.
+        Takes a [vector, edge] bool matrix and returns a [vector, node] label matrix.
+        Propagates the lowest label along enabled edges and shortcuts labels by pointer jumping until stable"""
+        toggle_matrix = np.asarray(toggle_matrix, dtype=bool)
+        if toggle_matrix.ndim == 1:
+            toggle_matrix = toggle_matrix[None, :]
+        vector_count = toggle_matrix.shape[0]
+        labels = np.tile(np.arange(self.node_count, dtype=np.int64), (vector_count, 1))
+        if self.node_count == 0 or self.edge_count == 0:
+            return labels
+
+        vectors, edges = np.nonzero(toggle_matrix)
+        sources, destinations = self.edge_sources[edges], self.edge_destinations[edges]
+        # Flat positions of the edge ends within the label matrix
+        source_positions = vectors * self.node_count + sources
+        destination_positions = vectors * self.node_count + destinations
+        rows = np.arange(vector_count)[:, None]
+        while True:
+            flat_labels = labels.reshape(-1)
+            lowest = np.minimum(flat_labels[source_positions], flat_labels[destination_positions])
+            # Hook the labels of both ends onto the lowest one
+            propagated = flat_labels.copy()
+            np.minimum.at(propagated, source_positions, lowest)
+            np.minimum.at(propagated, destination_positions, lowest)
+            np.minimum.at(propagated, vectors * self.node_count + flat_labels[source_positions], lowest)
+            np.minimum.at(propagated, vectors * self.node_count + flat_labels[destination_positions], lowest)
+            propagated = propagated.reshape(vector_count, self.node_count)
+            # Pointer jumping, labels are node indices themselves
+            while True:
+                jumped = propagated[rows, propagated]
+                if (jumped == propagated).all():
+                    break
+                propagated = jumped
+            if (propagated == labels).all():
+                return labels
+            labels = propagated
+
+    @staticmethod
+    def partition_key_from_labels(labels: Sequence[int]) -> Tuple[int, ...]:
+        """Returns the canonical identifier of the partition given by component labels:
+        the sorted node bitmasks of all components, in which bit i marks node i"""
+        node_masks = {}
+        for i, label in enumerate(labels):
+            node_masks[label] = node_masks.get(label, 0) | (1 << i)
+        return tuple(sorted(node_masks.values()))
+
+    def partition_key(self, toggles: Union[Sequence[bool], np.ndarray, int]) -> Tuple[int, ...]:
+        """Returns the canonical identifier of the partition a toggle vector induces.
+        Toggle vectors that result in the same components share the same key"""
+        return CompactGraph.partition_key_from_labels(self.component_labels(toggles))
+
+    def column_mask(self, node_indices: Sequence[int]) -> int:
+        """Returns the columns covered by any of the given nodes as bitmask"""
+        mask = 0
+        for i in node_indices:
+            mask |= self.node_column_masks[i]
+        return mask
+
+    def row_mask(self, node_indices: Sequence[int]) -> int:
+        """Returns the rows covered by any of the given nodes as bitmask"""
+        mask = 0
+        for i in node_indices:
+            mask |= self.node_row_masks[i]
+        return mask
+
+    def neighbours(self, node_index: int) -> np.ndarray:
+        """Returns the indices of all nodes connected to the given node, ascending"""
+        return self.adjacency_nodes[self.adjacency_offsets[node_index]:self.adjacency_offsets[node_index + 1]]
+
+    def edge_between(self, node_index: int, other_node_index: int) -> int:
+        """Returns the index of the edge connecting both nodes, -1 if they are not connected"""
+        start, stop = self.adjacency_offsets[node_index], self.adjacency_offsets[node_index + 1]
+        position = start + int(np.searchsorted(self.adjacency_nodes[start:stop], other_node_index))
+        if position < stop and self.adjacency_nodes[position] == other_node_index:
+            return int(self.adjacency_edges[position])
+        return -1
+
+    def alignment_bounding_box(self, edge_index: int) -> BoundingBox:
+        """Returns the alignment bounding box of an edge, see `Edge.get_alignment_bounding_box`"""
+        return BoundingBox(*self.edge_alignment_bounds[edge_index].tolist())
+
+    @cached_property
+    def node_masks_by_type(self) -> List[int]:
+        """Nodes of each type as bitmask, in which bit i marks node i. Indexed by type code"""
+        masks = [0 for _ in NODE_TYPES]
+        for i, code in enumerate(self.node_types.tolist()):
+            masks[code] |= 1 << i
+        return masks
+
+    @cached_property
+    def header_mask(self) -> int:
+        """Header nodes as bitmask, see `node_masks_by_type`"""
+        return self.node_mask_of_type(LabelRegionType.HEADER)
+
+    @cached_property
+    def data_mask(self) -> int:
+        """Data nodes as bitmask, see `node_masks_by_type`"""
+        return self.node_mask_of_type(LabelRegionType.DATA)
+
+    def node_mask_of_type(self, node_type: LabelRegionType) -> int:
+        """Returns the nodes of the given type as bitmask, in which bit i marks node i"""
+        return self.node_masks_by_type[NODE_TYPES.index(node_type)]
+
+    @cached_property
+    def header_adjacency(self) -> List[List[Tuple[int, int]]]:
+        """Header neighbours of each node, ascending, with the blocker mask of the connecting edge.
+        Blockers are the data nodes that intersect the alignment bounding box of the edge. Both headers belong to the
+        same header group of a component, if the component contains none of the blockers"""
+        header_code, data_code = NODE_TYPES.index(LabelRegionType.HEADER), NODE_TYPES.index(LabelRegionType.DATA)
+        header_edges = np.flatnonzero(
+            (self.node_types[self.edge_sources] == header_code)
+            & (self.node_types[self.edge_destinations] == header_code)
+        )
+        data_nodes = np.flatnonzero(self.node_types == data_code)
+        boxes = self.edge_alignment_bounds[header_edges]
+        data_bounds = self.node_bounds[data_nodes]
+        # [edge, data node] intersections of alignment bounding boxes and data nodes, see `BoundingBox.intersect`
+        blocked = (
+                (data_bounds[None, :, 3] >= boxes[:, None, 1]) & (boxes[:, None, 3] >= data_bounds[None, :, 1])
+                & (data_bounds[None, :, 2] >= boxes[:, None, 0]) & (boxes[:, None, 2] >= data_bounds[None, :, 0])
+        )
+
+        adjacency: List[List[Tuple[int, int]]] = [[] for _ in range(self.node_count)]
+        for edge_index, blocking_row in zip(header_edges.tolist(), blocked):
+            blockers = 0
+            for data_node in data_nodes[blocking_row].tolist():
+                blockers |= 1 << data_node
+            source, destination = self._edge_pairs[edge_index]
+            adjacency[source].append((destination, blockers))
+            adjacency[destination].append((source, blockers))
+        for neighbours in adjacency:
+            neighbours.sort()
+        return adjacency
+
+    def node_count_of_type(self, node_type: LabelRegionType) -> int:
+        return int(np.count_nonzero(self.node_types == NODE_TYPES.index(node_type)))
+
+    def edge_count_of_connection(self, connection_type: ConnectionType) -> int:
+        return int(np.count_nonzero(self.edge_connections == CONNECTION_TYPES.index(connection_type)))
@@ -0,0 +1,73 @@
+"""Enumeration of the partitions of a SpreadSheetGraph into connected components"""
+from typing import Iterator, List
+
+from graph.CompactGraph import mask_indices
+from graph.Partition import Partition
+
+
+class ConnectedPartitions(object):
+    """Enumerates the partitions of a graph's nodes into connected induced subgraphs, each exactly once.
+    Components are node bitmasks, see `CompactGraph`. Every partition is the component of the lowest remaining node,
+    a connected subset of the remaining nodes, combined with a partition of all other remaining nodes.
+    The number of such partitions is usually far below the 2^E edge toggle lists, which group the nodes alike
+    whenever they differ in redundant edges only"""
+
+    def __init__(self, graph):
+        # SpreadSheetGraph, not annotated to avoid a circular import
+        self.graph = graph
+        compact = graph.compact
+        self.all_nodes = (1 << compact.node_count) - 1
+        # Neighbours of each node as bitmask, regardless of the edge toggles
+        self.neighbour_masks = [0 for _ in range(compact.node_count)]
+        for source, destination in zip(compact.edge_sources.tolist(), compact.edge_destinations.tolist()):
+            self.neighbour_masks[source] |= 1 << destination
+            self.neighbour_masks[destination] |= 1 << source
+
+    def connected_subsets(self, node: int, allowed: int) -> List[int]:
+        """Returns all connected subsets of the allowed nodes that contain the given node, each exactly once.
+        Grows the subset by one neighbour at a time, a neighbour that was skipped is never added in that branch"""
+        subsets = []
+
+        def grow(subset: int, extension: int, excluded: int):
+            subsets.append(subset)
+            while extension:
+                candidate = extension & -extension
+                extension ^= candidate
+                grown = subset | candidate
+                neighbours = self.neighbour_masks[candidate.bit_length() - 1]
+                grow(grown, (extension | neighbours) & allowed & ~grown & ~excluded, excluded)
+                excluded |= candidate
+
+        grow(1 << node, self.neighbour_masks[node] & allowed, 0)
+        return subsets
+
+    def lowest_node_subsets(self, remaining: int) -> List[int]:
+        """Returns all connected subsets of the remaining nodes that contain the lowest remaining node"""
+        return self.connected_subsets((remaining & -remaining).bit_length() - 1, remaining)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        """Yields the component masks of every partition, the yielded list is reused for the next partition"""
+        components: List[int] = []
+
+        def partitions_of(remaining: int) -> Iterator[List[int]]:
+            if remaining == 0:
+                yield components
+                return
+            for component_mask in self.lowest_node_subsets(remaining):
+                components.append(component_mask)
+                yield from partitions_of(remaining & ~component_mask)
+                components.pop()
+
+        return partitions_of(self.all_nodes)
+
+    def partition(self, components: List[int]) -> Partition:
+        """Returns the partition, in which exactly the edges within the given components are enabled"""
+        compact = self.graph.compact
+        labels = [0 for _ in range(compact.node_count)]
+        for component_mask in components:
+            for i in mask_indices(component_mask):
+                labels[i] = component_mask
+        return self.graph.partition([
+            labels[source] == labels[destination]
+            for source, destination in zip(compact.edge_sources.tolist(), compact.edge_destinations.tolist())
+        ])
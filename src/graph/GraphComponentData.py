@@ -1,9 +1,9 @@
 """Class to represent a Graph Component, used to get attributes/data and cache them"""
 import logging
 from functools import cached_property
-from itertools import chain
-from typing import List
+from typing import Dict, List, Set
 
+from graph.CompactGraph import span_mask, mask_indices
 from graph.SpreadSheetGraph import SpreadSheetGraph
 from labelregions.BoundingBox import BoundingBox
 from labelregions.LabelRegion import LabelRegion
@@ -83,79 +83,51 @@ class GraphComponentData(object):
 
     @property
     def header_groups(self):
-        logger.debug(f"Searching header groups for component {sorted([n.id for n in self.label_regions])}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Searching header groups for component %s", sorted([n.id for n in self.label_regions]))
         if len(self.heads) == 0:
             return []
 
         if self._header_groups is None:
-            def belong_to_same_group(header1: LabelRegion, header2: LabelRegion):
-                edges = self.graph.node_edges_lookup[header1]
-                # Filter for edges connecting h1 and h2
-                edges_h1_h2 = [edge for edge in edges if edge.source == header2 or edge.destination == header2]
-                if (len(edges_h1_h2)) == 0:
-                    # No edge connecting h1 and h2
-                    return False
-
-                # There can only be one edge between two nodes
-                edge = edges_h1_h2[0]
-                # Check whether there is a "blocking" data row in between
-                # The box containing all rows/cols between both headers
-                # but spanning only common indices
-                alignment_bounding_box = edge.get_alignment_bounding_box()
-                for data_lr in self.data:
-                    if alignment_bounding_box.intersect(data_lr):
-                        return False
-                return True
-
-            def belongs_to_group(group: List[LabelRegion], header: LabelRegion):
-                belongs = [belong_to_same_group(h, header) for h in group]
-                return any(belongs)
-
-            if len(self.heads) == 0:
-                # No headers in this component, no header groups, skip top header init
-                return []
-
-            # BFS
-            grouped_lrs = []
-            groups = []
+            # Two headers belong to the same group, if they are connected by an edge, whose alignment bounding box
+            # (spanning the rows/cols between both headers but only their common indices) contains no data label
+            # region of this component. Groups are the headers connected by such edges, see
+            # `CompactGraph.header_adjacency`
+            compact = self.graph.compact
+            head_indices = [self.graph.node_index_lookup[header] for header in self.heads]
+            head_mask = self.node_mask & compact.header_mask
+            data_mask = self.node_mask & compact.data_mask
+
+            # Union-find over the unblocked header edges within this component
+            parent = dict([(i, i) for i in head_indices])
+
+            def find(i: int) -> int:
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+
+            for i in head_indices:
+                for neighbour, blockers in compact.header_adjacency[i]:
+                    if head_mask >> neighbour & 1 and blockers & data_mask == 0:
+                        parent[find(neighbour)] = find(i)
+
+            # Groups are ordered by their first header, as are the headers within each group
+            groups_by_root: Dict[int, List[LabelRegion]] = {}
+            for header, i in zip(self.heads, head_indices):
+                groups_by_root.setdefault(find(i), []).append(header)
+            groups = list(groups_by_root.values())
+
+            # The top header group is the last group reaching the highest row
             header_top = [self.heads[0]]
             header_top_lowest_row_index = self.heads[0].top
-            for header in self.heads:
-                if header in grouped_lrs:
-                    continue
-                logger.debug(f"Finding groups for {header.id}")
-                group: List[LabelRegion] = [header]
-                group_lowest_row = header.top
-                grouped_lrs.append(header)
-                neighbours = self.graph.get_neighbours(header)
-
-                logger.debug(f"Direct neighbours:  {sorted([n.id for n in neighbours])}")
-                # Filter for only header neighbours that are in this component
-                header_neighbours = [
-                    n for n in neighbours if n.type == LabelRegionType.HEADER and n in self.label_regions
-                ]
-                logger.debug(f"Direct filtered neighbours:  {sorted([n.id for n in header_neighbours])}")
-
-                while len(header_neighbours) > 0:
-                    hn = header_neighbours.pop(0)
-                    if hn in grouped_lrs:
-                        continue
-                    if belongs_to_group(group, hn):
-                        logger.debug(f"\t{hn.id} belongs to same group!")
-                        group.append(hn)
-                        if hn.top < group_lowest_row:
-                            group_lowest_row = hn.top
-                        neighbours = self.graph.get_neighbours(hn)
-                        header_neighbours.extend([
-                            n for n in neighbours if
-                            n.type == LabelRegionType.HEADER and n in self.label_regions and n not in grouped_lrs
-                        ])
-                        logger.debug(f"\tIndirect neighbours:  {set(sorted([n.id for n in header_neighbours]))}")
-                        grouped_lrs.append(hn)
-                groups.append(group)
+            for group in groups:
+                group_lowest_row = min([header.top for header in group])
                 if group_lowest_row <= header_top_lowest_row_index:
                     header_top_lowest_row_index = group_lowest_row
                     header_top = group
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Header groups: %s", [sorted([header.id for header in group]) for group in groups])
 
             self._header_groups = groups
             self._header_top = header_top
@@ -180,20 +152,66 @@ class GraphComponentData(object):
             _ = self.header_groups
         return self._header_top_row
 
+    @cached_property
+    def node_mask(self) -> int:
+        """Bitmask of the label regions of this component, bit i marks the i-th node of the graph"""
+        mask = 0
+        for label_region in self.label_regions:
+            mask |= 1 << self.graph.node_index_lookup[label_region]
+        return mask
+
+    def column_mask_of(self, label_regions: List[LabelRegion]) -> int:
+        """Returns the columns covered by any of the given label regions as bitmask, see `CompactGraph`"""
+        return self.graph.compact.column_mask([self.graph.node_index_lookup[lr] for lr in label_regions])
+
+    def row_mask_of(self, label_regions: List[LabelRegion]) -> int:
+        """Returns the rows covered by any of the given label regions as bitmask, see `CompactGraph`"""
+        return self.graph.compact.row_mask([self.graph.node_index_lookup[lr] for lr in label_regions])
+
+    @cached_property
+    def column_mask(self) -> int:
+        """Columns covered by at least one label region of this component"""
+        return self.column_mask_of(self.label_regions)
+
+    @cached_property
+    def row_mask(self) -> int:
+        """Rows covered by at least one label region of this component"""
+        return self.row_mask_of(self.label_regions)
+
+    @cached_property
+    def bounding_box_column_mask(self) -> int:
+        """Columns within the bounding box of this component"""
+        origin = self.graph.compact.column_origin
+        return span_mask(self.bounding_box.left - origin, self.bounding_box.right - origin)
+
+    @cached_property
+    def bounding_box_row_mask(self) -> int:
+        """Rows within the bounding box of this component"""
+        origin = self.graph.compact.row_origin
+        return span_mask(self.bounding_box.top - origin, self.bounding_box.bottom - origin)
+
+    @cached_property
+    def c_ht_mask(self) -> int:
+        """Columns covered by the top header group"""
+        return self.column_mask_of(self.header_top)
+
+    @cached_property
+    def c_d_mask(self) -> int:
+        """Columns covered by data label regions"""
+        return self.column_mask_of(self.data)
+
     @property
-    def c_ht(self):
+    def c_ht(self) -> Set[int]:
         if self._c_ht is None:
-            x_lists = [lr.get_all_x() for lr in self.header_top]
-            x_s = list(chain(*x_lists))
-            self._c_ht = set(x_s)
+            origin = self.graph.compact.column_origin
+            self._c_ht = set([origin + i for i in mask_indices(self.c_ht_mask)])
         return self._c_ht
 
     @property
-    def c_d(self):
+    def c_d(self) -> Set[int]:
         if self._c_d is None:
-            x_lists = [lr.get_all_x() for lr in self.data]
-            x_s = list(chain(*x_lists))
-            self._c_d = set(x_s)
+            origin = self.graph.compact.column_origin
+            self._c_d = set([origin + i for i in mask_indices(self.c_d_mask)])
         return self._c_d
 
     def __str__(self):
@@ -0,0 +1,60 @@
+"""Partition of the nodes of a SpreadSheetGraph into components"""
+from functools import cached_property
+from typing import List, Sequence, Tuple
+
+from graph.Edge import Edge
+from labelregions.BoundingBox import BoundingBox
+from labelregions.LabelRegion import LabelRegion
+
+
+class Partition(object):
+    """Immutable partition of a graph, given by the edges that are enabled.
+    Components are the connected nodes in regard of the enabled edges. Neither the graph nor the partition change,
+    so partitions of one graph can be rated from any number of threads"""
+
+    def __init__(self, graph, edge_toggle_list: Sequence[bool]):
+        # SpreadSheetGraph, not annotated to avoid a circular import
+        self.graph = graph
+        if len(edge_toggle_list) != len(graph.edge_list):
+            raise ValueError("Edge toggle list does not match the edges of the graph!")
+        self._edge_toggle_list: Tuple[bool, ...] = tuple([bool(toggle) for toggle in edge_toggle_list])
+
+    @property
+    def edge_toggle_list(self) -> Tuple[bool, ...]:
+        """Whether each edge of the graph is enabled"""
+        return self._edge_toggle_list
+
+    @cached_property
+    def labels(self) -> Tuple[int, ...]:
+        """Component label of each node, see `CompactGraph.component_labels`"""
+        return tuple(self.graph.compact.component_labels(self._edge_toggle_list))
+
+    @cached_property
+    def key(self) -> Tuple[int, ...]:
+        """Canonical identifier of the partition, see `CompactGraph.partition_key`"""
+        return self.graph.compact.partition_key_from_labels(self.labels)
+
+    def get_components(self) -> List[List[LabelRegion]]:
+        """Returns the components of the partition, ordered by their first node"""
+        return self.graph.components_from_labels(self.labels)
+
+    def get_table_definitions(self) -> List[BoundingBox]:
+        return [BoundingBox.merge(component) for component in self.get_components()]
+
+    def enabled_edges(self) -> List[Edge]:
+        """Returns all enabled edges"""
+        return [edge for edge, toggle in zip(self.graph.edge_list, self._edge_toggle_list) if toggle]
+
+    def disabled_edges(self) -> List[Edge]:
+        """Returns all disabled edges"""
+        return [edge for edge, toggle in zip(self.graph.edge_list, self._edge_toggle_list) if not toggle]
+
+    def __eq__(self, other):
+        """Partitions are equal if they group the nodes of the same graph alike, regardless of redundant edges"""
+        return isinstance(other, Partition) and self.graph is other.graph and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return f"Partition({len(set(self.labels))} components of {self.graph.sheet_data})"
@@ -1,11 +1,16 @@
 """Creates a Graph from Label Regions"""
 import logging
-from typing import List, Dict, Set
-
-from openpyxl.worksheet.worksheet import Worksheet
+import sys
+from bisect import bisect_right
+from functools import cached_property
+from hashlib import sha1
+from typing import List, Dict, Set, Tuple, Sequence
 
 from dataset.SheetData import SheetData
+from dataset.SheetGeometry import SheetGeometry
+from graph.CompactGraph import CompactGraph
 from graph.Edge import Edge, AlignmentType
+from graph.Partition import Partition
 from labelregions.BoundingBox import BoundingBox
 from labelregions.LabelRegion import LabelRegion
 
@@ -20,10 +25,16 @@ class SpreadSheetGraph(object):
         self.sheet_data = sheetdata
         self.nodes: List[LabelRegion] = sheetdata.label_regions
         self.node_id_lookup: Dict[int, LabelRegion] = dict([(node.id, node) for node in self.nodes])
+        # Position of each node in `nodes`, which is its index in the compact graph
+        self.node_index_lookup: Dict[LabelRegion, int] = dict([(node, i) for i, node in enumerate(self.nodes)])
         self.edge_list: List[Edge] = self.get_generate_edge_list()
-        self.sheet: Worksheet = sheetdata.worksheet
+        self.geometry: SheetGeometry = sheetdata.geometry
 
-        self.edge_toggle_list: List[bool] = self.edge_toggle_list_from_table_definition(sheetdata.table_definitions)
+        # Partition of the annotated tables, the target of training and evaluation
+        self.target_partition = Partition(
+            self,
+            self.edge_toggle_list_from_table_definition(sheetdata.table_definitions),
+        )
 
         self.node_edges_lookup: Dict[LabelRegion, Set[Edge]] = {}
         for node in self.nodes:
@@ -39,17 +50,69 @@ class SpreadSheetGraph(object):
             self.node_edges_lookup[edge.source].add(edge)
             self.node_edges_lookup[edge.destination].add(edge)
 
-    def enable_all_edges(self):
-        self.edge_toggle_list = [True for _ in range(len(self.edge_toggle_list))]
+    @cached_property
+    def id(self) -> str:
+        """Identity hash of this graph, covers the sheet and all label regions
+        Used as cache key, so caches do not keep graphs or sheets alive"""
+        h = sha1(self.geometry.id.encode())
+        for node in self.nodes:
+            h.update(f"|{node.id},{node.type.value},{node.top},{node.left},{node.bottom},{node.right}".encode())
+        return h.hexdigest()
+
+    @cached_property
+    def compact(self) -> CompactGraph:
+        """Array representation of the nodes and edges of this graph"""
+        return CompactGraph(self.nodes, self.edge_list)
 
-    def get_neighbours(self, node) -> List[LabelRegion]:
-        edges = self.node_edges_lookup[node]
+    @property
+    def edge_toggle_list(self) -> List[bool]:
+        """Edge toggle list of the target partition"""
+        return list(self.target_partition.edge_toggle_list)
 
-        def get_partner_from_edge(edge: Edge):
-            return edge.source if edge.source != node else edge.destination
+    def partition(self, edge_toggle_list: Sequence[bool]) -> Partition:
+        """Returns the partition of this graph the given edge toggle list induces"""
+        return Partition(self, edge_toggle_list)
 
-        nodes = set([get_partner_from_edge(edge) for edge in edges])
-        return list(nodes)
+    def all_edges_partition(self) -> Partition:
+        """Returns the partition with all edges enabled"""
+        return Partition(self, [True for _ in range(len(self.edge_list))])
+
+    def get_neighbours(self, node) -> List[LabelRegion]:
+        neighbours = self.compact.neighbours(self.node_index_lookup[node])
+        return [self.nodes[i] for i in neighbours.tolist()]
+
+    @staticmethod
+    def _first_cover_alignments(intervals: List[Tuple[int, int]]) -> List[List[Tuple[int, List[int]]]]:
+        """Takes the inclusive index intervals of nodes in sort order. Every index of an interval is aligned to the
+        first later interval that covers it, which eats the index up for all intervals after that one.
+        Returns for each interval the later intervals it is aligned to, with the aligned indices, in sort order.
+        Sweeps from the last to the first interval, keeping a map from indices to the first interval covering them"""
+        # Segment k spans starts[k] to starts[k + 1] - 1 and is first covered by interval owners[k], -1 for none
+        starts = [-sys.maxsize]
+        owners = [-1]
+
+        def split(index: int) -> int:
+            """Makes sure a segment starts at the given index and returns that segment"""
+            k = bisect_right(starts, index) - 1
+            if starts[k] != index:
+                k += 1
+                starts.insert(k, index)
+                owners.insert(k, owners[k - 1])
+            return k
+
+        alignments = [[] for _ in intervals]
+        for i in reversed(range(len(intervals))):
+            low, high = intervals[i]
+            first, stop = split(low), split(high + 1)
+            aligned_indices = {}
+            for k in range(first, stop):
+                if owners[k] != -1:
+                    aligned_indices.setdefault(owners[k], []).extend(range(starts[k], starts[k + 1]))
+            alignments[i] = sorted(aligned_indices.items())
+            # Interval i now is the first one to cover all its indices
+            starts[first:stop] = [low]
+            owners[first:stop] = [i]
+        return alignments
 
     def get_generate_edge_list(self):
         """Creates a graph from label regions
@@ -59,49 +122,27 @@ class SpreadSheetGraph(object):
         # That means that three regions H1, D1, H2 that span the exact same cols and are directly on top of each other
         # That H1 is not connected to H2, because the edge H1-D1 already uses all col indices
         logger.debug("Creating Spreadsheet Graph...")
-        existing_edges = []
+        existing_edges = set()
         edge_list = []
 
-        # Vertical Overlap
         sorted_by_y = sorted(self.nodes, key=lambda node: node.top)
-        for i, source in enumerate(sorted_by_y):
-            source_xs = set(source.get_all_x())
-            for j, destination in enumerate(sorted_by_y):
-                destination_bottom_of_source = i < j
-                if destination_bottom_of_source:
-                    # Two different label regions, dest right of source
-                    destination_xs = set(destination.get_all_x())
-
-                    intersection = source_xs.intersection(destination_xs)
-                    vertical_overlap = True if len(intersection) > 0 else False
-                    if vertical_overlap:
-                        # Eat up indices
-                        source_xs = source_xs - destination_xs
-                        # Make sure edges exist only once, regardless on order of source and dest
-                        if ((source.id, destination.id) not in existing_edges and
-                                (destination.id, source.id) not in existing_edges):
-                            existing_edges.extend([(source.id, destination.id), (destination.id, source.id)])
-                            edge_list.append(Edge(source, destination, list(intersection), AlignmentType.VERTICAL))
-
-        # Horizontal Overlap
         sorted_by_x = sorted(self.nodes, key=lambda node: node.left)
-        for i, source in enumerate(sorted_by_x):
-            source_ys = set(source.get_all_y())
-            for j, destination in enumerate(sorted_by_x):
-                destination_right_of_source = i < j
-                if destination_right_of_source:
-                    # Two different label regions, dest bottom of source
-                    destination_ys = set(destination.get_all_y())
-
-                    intersection = source_ys.intersection(destination_ys)
-                    horizontal_overlap = True if len(intersection) > 0 else False
-                    source_ys = source_ys - destination_ys
-                    if horizontal_overlap:
-                        # Make sure edges exist only once, regardless on order of source and dest
-                        if ((source.id, destination.id) not in existing_edges and
-                                (destination.id, source.id) not in existing_edges):
-                            existing_edges.extend([(source.id, destination.id), (destination.id, source.id)])
-                            edge_list.append(Edge(source, destination, list(intersection), AlignmentType.HORIZONTAL))
+        overlaps = [
+            # Vertical Overlap, on col indices of regions below
+            (AlignmentType.VERTICAL, sorted_by_y, [(node.left, node.right) for node in sorted_by_y]),
+            # Horizontal Overlap, on row indices of regions right of
+            (AlignmentType.HORIZONTAL, sorted_by_x, [(node.top, node.bottom) for node in sorted_by_x]),
+        ]
+        for alignment_type, sorted_nodes, intervals in overlaps:
+            for source, alignments in zip(sorted_nodes, self._first_cover_alignments(intervals)):
+                for j, aligned_indices in alignments:
+                    destination = sorted_nodes[j]
+                    # Make sure edges exist only once, regardless on order of source and dest
+                    pair = (min(source.id, destination.id), max(source.id, destination.id))
+                    if pair in existing_edges:
+                        continue
+                    existing_edges.add(pair)
+                    edge_list.append(Edge(source, destination, aligned_indices, alignment_type))
 
         return edge_list
 
@@ -129,12 +170,12 @@ class SpreadSheetGraph(object):
         return edge_toggle_list
 
     def enabled_edges(self):
-        """Returns all enabled edges"""
-        return [edge for i, edge in enumerate(self.edge_list) if self.edge_toggle_list[i] is True]
+        """Returns all enabled edges of the target partition"""
+        return self.target_partition.enabled_edges()
 
     def disabled_edges(self):
-        """Returns all disabled edges"""
-        return [edge for i, edge in enumerate(self.edge_list) if self.edge_toggle_list[i] is False]
+        """Returns all disabled edges of the target partition"""
+        return self.target_partition.disabled_edges()
 
     def build_adj_list(self, edges: List[Edge]) -> Dict[LabelRegion, Set[LabelRegion]]:
         """Creates a adj list from the edge list and the edge toggle list"""
@@ -155,28 +196,17 @@ class SpreadSheetGraph(object):
         return adj_list
 
     def get_components(self) -> List[List[LabelRegion]]:
-        """Returns graph components in regard of toggled edges"""
-        components: List[List[LabelRegion]] = []
+        """Returns the components of the target partition"""
+        return self.target_partition.get_components()
 
-        visited: List[int] = []
-        adj_list = self.build_adj_list(self.enabled_edges())
-        for node in self.nodes:
-            if node.id in visited:
-                # Node already marked and therefore already part of a component
-                continue
-            visited.append(node.id)
-            component = [node]
-            queue = adj_list[node]
-            while queue:
-                connected_node = queue.pop()
-                if connected_node.id in visited:
-                    continue
-                visited.append(connected_node.id)
-                component.append(connected_node)
-                queue = queue.union(adj_list[connected_node])
-            components.append(component)
-
-        return components
+    def components_from_labels(self, labels: Sequence[int]) -> List[List[LabelRegion]]:
+        """Groups nodes by component label, see `CompactGraph.component_labels`
+        Components are ordered by their first node and contain their nodes in order"""
+        components: Dict[int, List[LabelRegion]] = {}
+        for node, label in zip(self.nodes, labels):
+            components.setdefault(label, []).append(node)
+        return list(components.values())
 
     def get_table_definitions(self):
-        return [BoundingBox.merge(component) for component in self.get_components()]
+        """Returns the table definitions of the target partition"""
+        return self.target_partition.get_table_definitions()
@@ -76,6 +76,10 @@ class BoundingBox(object):
         max_y = max(rights)
         return BoundingBox(min_x, min_y, max_x, max_y)
 
+    def __reduce__(self):
+        # Pickle via the constructor, the default pickling relies on `__dict__` which is overridden below
+        return BoundingBox, (self.top, self.left, self.bottom, self.right)
+
     def __dict__(self):
         return {
             "top": self.top,
@@ -12,5 +12,8 @@ class LabelRegion(BoundingBox):
     def from_bounding_box(lr_id: int, lr_type: LabelRegionType, box: BoundingBox):
         return LabelRegion(lr_id, lr_type, box.top, box.left, box.bottom, box.right)
 
+    def __reduce__(self):
+        return LabelRegion, (self.id, self.type, self.top, self.left, self.bottom, self.right)
+
     def __str__(self):
         return str(self.id)
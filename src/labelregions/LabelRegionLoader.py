@@ -1,23 +1,43 @@
 import logging
 import math
 import random
-from typing import List, Dict, Tuple
+from typing import Any, List, Dict, Tuple
 
+import numpy as np
 from openpyxl.worksheet.worksheet import Worksheet
 
+from dataset.SheetFeatures import SheetFeatures
 from labelregions.BoundingBox import BoundingBox
 from labelregions.LabelRegion import LabelRegion
+from labelregions.LabelRegionRaster import LabelGrid, NO_LABEL, lrs_from_grid
+from labelregions.LabelRegionRectangles import RectangleBands
 from labelregions.LabelRegionType import LabelRegionType
+from labelregions.OccupancyIndex import OccupancyIndex
 
 logger = logging.getLogger(__name__)
 
 
+# Per cell dicts, as described by Koci et al.
+CELL_ENGINE = "cells"
+# Label grid and run lengths, see LabelRegionRaster
+RASTER_ENGINE = "raster"
+# Row bands of annotation rectangles, see LabelRegionRectangles
+RECTANGLE_ENGINE = "rectangles"
+
+ENGINES = [CELL_ENGINE, RASTER_ENGINE, RECTANGLE_ENGINE]
+
+
 class LabelRegionLoader(object):
-    def __init__(self, remove_empty_cells=True, introduce_noise=False):
+    def __init__(self, remove_empty_cells=True, introduce_noise=False, engine=RASTER_ENGINE):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown label region engine {engine}, choose one of {ENGINES}")
         self.remove_empty_cells = remove_empty_cells
         self.introduce_noise = introduce_noise
+        # All engines produce the same label regions
+        self.engine = engine
         self.noise_rate = 0.001
-        self._worksheet = None
+        # Boolean [y, x] occupancy grid of the sheet that is currently loaded, see `occupancy_grid`
+        self._non_empty_mask = None
 
     @staticmethod
     def _flatten_label_regions(table_annotations):
@@ -73,13 +93,11 @@ class LabelRegionLoader(object):
     def _cell_empty(self, cell):
         """Returns whether the value at this cell is
         empty (only whitespace)"""
-
-        # Increase coordinates by one as our annotations are indexed
-        # starting from 0 and openpyxl is indexed starting from 1
-        return self._worksheet.cell(
-            row=cell["y"] + 1,
-            column=cell["x"] + 1,
-        ).value is None
+        # Cells outside of the grid are outside of the sheet's used range
+        height, width = self._non_empty_mask.shape
+        if cell["y"] >= height or cell["x"] >= width:
+            return True
+        return not self._non_empty_mask[cell["y"], cell["x"]]
 
     @staticmethod
     def _merge_labled_cells_into_lrs(cell_rows) -> List[LabelRegion]:
@@ -169,8 +187,8 @@ class LabelRegionLoader(object):
             lrs.append(LabelRegion(lr_id, LabelRegionType(lr_type), top, left, bottom, right))
         return lrs
 
-    def _introduce_noise(self, cell_rows: List):
-        """Relabels or omits cells"""
+    def _introduce_noise(self, cell_rows: List, rng=random):
+        """Relabels or omits cells, draws from the given random stream"""
         # Create index map
         indices = []
         for y, row in enumerate(cell_rows):
@@ -178,9 +196,9 @@ class LabelRegionLoader(object):
 
         total_cells = len(indices)
         noise_cell_count = min(1, math.ceil(self.noise_rate * total_cells))
-        indices_to_be_noised = random.sample(indices, noise_cell_count)
+        indices_to_be_noised = rng.sample(indices, noise_cell_count)
         for y, x in indices_to_be_noised:
-            if random.randint(0, 1) == 0:
+            if rng.randint(0, 1) == 0:
                 # Relabel
                 new_label = "Data"
                 if cell_rows[y][x]["type"] == new_label:
@@ -200,30 +218,192 @@ class LabelRegionLoader(object):
         # Remove now potentially empty rows
         return [row for y, row in enumerate(cell_rows) if y not in empty_row_indices]
 
-    def load_label_regions_and_table_definitions(self, sheet: Worksheet, annotations: Dict) -> Tuple[
-        List[LabelRegion], List[BoundingBox]]:
-        """Reads annotations and returns label regions and table definitions, coords start at one"""
-        self._worksheet = sheet
-        table_annotations = [region for region in annotations["regions"] if region["region_type"] == "Table"]
-        table_definitions = []
-        for table_annotation in table_annotations:
-            left, top = table_annotation["top_lx"]
-            right, bottom = table_annotation["bot_rx"]
-            table_definitions.append(BoundingBox(top + 1, left + 1, bottom + 1, right + 1))
+    def _introduce_noise_into_grid(self, grid: LabelGrid, rng=random):
+        """Relabels or omits cells of a label grid
+        Consumes the random stream exactly like `_introduce_noise` does on the equivalent cell rows"""
+        # Cells in the same order as the cell rows, row by row and left to right
+        ys, xs = np.nonzero(grid.labels)
+        total_cells = len(ys)
+        noise_cell_count = min(1, math.ceil(self.noise_rate * total_cells))
+        indices_to_be_noised = np.array(rng.sample(range(total_cells), noise_cell_count), dtype=np.int64)
+        relabel = np.array([rng.randint(0, 1) == 0 for _ in range(noise_cell_count)], dtype=bool)
+
+        ys, xs = ys[indices_to_be_noised], xs[indices_to_be_noised]
+        # Omit all cells that are not relabeled
+        new_labels = np.full(noise_cell_count, NO_LABEL, dtype=grid.labels.dtype)
+        if relabel.any():
+            data_code, header_code = grid.code_of("Data"), grid.code_of("Header")
+            old_labels = grid.labels[ys[relabel], xs[relabel]]
+            new_labels[relabel] = np.where(old_labels == data_code, header_code, data_code)
+        grid.labels[ys, xs] = new_labels
+
+    def _introduce_noise_into_bands(self, bands: RectangleBands, rng=random):
+        """Relabels or omits cells of row bands
+        Consumes the random stream exactly like `_introduce_noise` does on the equivalent cell rows"""
+        cell_offsets = bands.cell_offsets()
+        total_cells = cell_offsets[-1]
+        noise_cell_count = min(1, math.ceil(self.noise_rate * total_cells))
+        indices_to_be_noised = rng.sample(range(total_cells), noise_cell_count)
+        relabels = []
+        for i in indices_to_be_noised:
+            band_index, y, x = bands.locate_cell(i, cell_offsets)
+            if rng.randint(0, 1) == 0:
+                # Relabel
+                new_label = "Data"
+                if bands.label_of(band_index, x) == new_label:
+                    new_label = "Header"
+                relabels.append((y, x, bands.code_of(new_label)))
+            else:
+                # Omit
+                relabels.append((y, x, None))
+        bands.relabel_cells(relabels)
+
+    def _annotated_cells(self, flat_lrs: Dict[str, Dict]) -> Tuple[str, Any]:
+        """Returns the engine that is used and the annotated cells in its representation, empty cells removed.
+        Falls back to the cell engine if annotations overlap"""
+        if self.engine == RASTER_ENGINE:
+            logger.debug("Painting Label Regions into a Grid...")
+            grid = LabelGrid.paint(flat_lrs)
+            if grid is not None:
+                if self.remove_empty_cells:
+                    logger.debug("Removing Empty Cells...")
+                    grid.remove_empty_cells(self._non_empty_mask)
+                return RASTER_ENGINE, grid
+            # A grid holds one label per cell
+            logger.debug("Annotations overlap, falling back to the cell engine")
+
+        if self.engine == RECTANGLE_ENGINE:
+            logger.debug("Cutting Label Regions into Row Bands...")
+            occupancy_index = OccupancyIndex.from_grid(self._non_empty_mask) if self.remove_empty_cells else None
+            bands = RectangleBands.from_rectangles(flat_lrs, occupancy_index)
+            if bands is not None:
+                return RECTANGLE_ENGINE, bands
+            # Bands hold one label per cell
+            logger.debug("Annotations overlap, falling back to the cell engine")
 
-        logger.debug("Flattening Label Regions...")
-        flattend_lrs = self._flatten_label_regions(table_annotations)
         logger.debug("Splitting Chair Label Regions into Cells...")
-        cell_rows = self._split_lrs_into_cells(flattend_lrs)
+        cell_rows = self._split_lrs_into_cells(flat_lrs)
 
         if self.remove_empty_cells:
             logger.debug("Removing Empty Cells...")
             cell_rows = self._remove_empty_cells(cell_rows)
+        return CELL_ENGINE, cell_rows
 
-        if self.introduce_noise:
+    @staticmethod
+    def _copy_annotated_cells(engine: str, cells: Any) -> Any:
+        """Returns an independent copy of annotated cells, as noise and merging modify them"""
+        if engine == CELL_ENGINE:
+            return [[dict(cell) for cell in row] for row in cells]
+        return cells.copy()
+
+    def _lrs_from_annotated_cells(self, engine: str, cells: Any, rng=None) -> List[LabelRegion]:
+        """Merges annotated cells into label regions. Introduces noise drawn from rng, unless it is None.
+        Modifies the given cells"""
+        if rng is not None:
             logger.debug("Introducing Noise")
-            cell_rows = self._introduce_noise(cell_rows)
 
+        # Rows that lost all their cells still separate label regions, unless noise is introduced
+        if engine == RASTER_ENGINE:
+            present_rows = cells.annotated_rows
+            if rng is not None:
+                self._introduce_noise_into_grid(cells, rng)
+                present_rows = cells.labels.any(axis=1)
+            logger.debug("Merging Runs into Paper Label Regions...")
+            return lrs_from_grid(cells, present_rows)
+
+        if engine == RECTANGLE_ENGINE:
+            if rng is not None:
+                self._introduce_noise_into_bands(cells, rng)
+            logger.debug("Merging Bands into Paper Label Regions...")
+            return cells.lrs(skip_empty_rows=rng is not None)
+
+        if rng is not None:
+            cells = self._introduce_noise(cells, rng)
         logger.debug("Merging Cells into Paper Label Regions...")
-        label_regions = self._merge_labled_cells_into_lrs(cell_rows)
+        return self._merge_labled_cells_into_lrs(cells)
+
+    @staticmethod
+    def _table_annotations(annotations: Dict) -> List[Dict]:
+        """Returns the annotations of all table regions"""
+        return [region for region in annotations["regions"] if region["region_type"] == "Table"]
+
+    @staticmethod
+    def _table_definitions(table_annotations: List[Dict]) -> List[BoundingBox]:
+        """Returns the bounding boxes of the given table annotations, coords start at one"""
+        table_definitions = []
+        for table_annotation in table_annotations:
+            left, top = table_annotation["top_lx"]
+            right, bottom = table_annotation["bot_rx"]
+            table_definitions.append(BoundingBox(top + 1, left + 1, bottom + 1, right + 1))
+        return table_definitions
+
+    @staticmethod
+    def occupancy_grid(sheet: Worksheet) -> np.ndarray:
+        """Returns a boolean [y, x] grid over the sheet's used range, True for all cells that are not empty.
+        Coords start at zero, like the annotations, while openpyxl starts at one.
+        Built in a single pass over the sheet's values, so it also works for read only worksheets"""
+        rows = []
+        for row in sheet.iter_rows(min_row=1, min_col=1, values_only=True):
+            rows.append([value is not None for value in row])
+
+        width = max([len(row) for row in rows], default=0)
+        grid = np.zeros((len(rows), width), dtype=bool)
+        for y, row in enumerate(rows):
+            grid[y, :len(row)] = row
+        return grid
+
+    def load_label_regions_and_table_definitions(self, sheet: Worksheet, annotations: Dict) -> Tuple[
+        List[LabelRegion], List[BoundingBox]]:
+        """Reads annotations and returns label regions and table definitions, coords start at one"""
+        return self.load_label_regions_and_table_definitions_from_mask(self.occupancy_grid(sheet), annotations)
+
+    def load_label_regions_and_table_definitions_from_mask(self, non_empty_mask: np.ndarray, annotations: Dict) -> \
+            Tuple[List[LabelRegion], List[BoundingBox]]:
+        """Same as `load_label_regions_and_table_definitions`, but looks up empty cells in
+        an occupancy grid created by `occupancy_grid` instead of the worksheet"""
+        self._non_empty_mask = non_empty_mask
+        try:
+            return self._load_label_regions_and_table_definitions(annotations)
+        finally:
+            self._non_empty_mask = None
+
+    def load_label_regions_and_table_definitions_from_features(self, features: SheetFeatures, annotations: Dict) -> \
+            Tuple[List[LabelRegion], List[BoundingBox]]:
+        """Serves label regions and table definitions from cached sheet features
+        The cached label regions are only valid for loaders with default settings, otherwise the
+        cached non empty cell mask is used to recreate them"""
+        if self.remove_empty_cells and not self.introduce_noise:
+            return features.label_regions, features.table_definitions
+        return self.load_label_regions_and_table_definitions_from_mask(features.non_empty_mask, annotations)
+
+    def load_noisy_label_region_variants_from_mask(self, non_empty_mask: np.ndarray, annotations: Dict,
+                                                   seeds: List[int]) -> \
+            Tuple[List[List[LabelRegion]], List[BoundingBox]]:
+        """Loads the annotated cells of a sheet once and derives one noisy set of label regions per seed.
+        Each variant draws from its own `random.Random(seed)`, independent of `introduce_noise` and the global
+        random state. A variant equals a regular noisy load after `random.seed(seed)`"""
+        self._non_empty_mask = non_empty_mask
+        try:
+            table_annotations = self._table_annotations(annotations)
+            logger.debug("Flattening Label Regions...")
+            engine, cells = self._annotated_cells(self._flatten_label_regions(table_annotations))
+        finally:
+            self._non_empty_mask = None
+
+        variants = []
+        for seed in seeds:
+            variant_cells = self._copy_annotated_cells(engine, cells)
+            variants.append(self._lrs_from_annotated_cells(engine, variant_cells, random.Random(seed)))
+        return variants, self._table_definitions(table_annotations)
+
+    def _load_label_regions_and_table_definitions(self, annotations: Dict) -> Tuple[
+        List[LabelRegion], List[BoundingBox]]:
+        """Reads annotations and returns label regions and table definitions, coords start at one"""
+        table_annotations = self._table_annotations(annotations)
+        table_definitions = self._table_definitions(table_annotations)
+
+        logger.debug("Flattening Label Regions...")
+        flattend_lrs = self._flatten_label_regions(table_annotations)
+        engine, cells = self._annotated_cells(flattend_lrs)
+        label_regions = self._lrs_from_annotated_cells(engine, cells, random if self.introduce_noise else None)
         return label_regions, table_definitions
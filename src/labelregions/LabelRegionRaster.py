@@ -0,0 +1,163 @@
+"""Array based derivation of label regions from annotations.
+Produces the same label regions as the cell based algorithm of the LabelRegionLoader, but paints the annotations
+into an integer label grid and works on run lengths instead of per cell dicts"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from labelregions.LabelRegion import LabelRegion
+from labelregions.LabelRegionType import LabelRegionType
+
+logger = logging.getLogger(__name__)
+
+# Grid value of cells without label
+NO_LABEL = 0
+
+
+class LabelGrid(object):
+    """Annotated cells of a sheet, painted into the bounding box of all annotations"""
+
+    def __init__(self, labels: np.ndarray, annotated_rows: np.ndarray, top: int, left: int, type_names: List[str]):
+        # [y, x] label codes relative to top/left, 0 marks cells without label
+        self.labels = labels
+        # Rows that contain at least one annotated cell, independent of later removals
+        self.annotated_rows = annotated_rows
+        self.top = top
+        self.left = left
+        # Label code - 1 to annotation type
+        self.type_names = type_names
+
+    def code_of(self, type_name: str) -> int:
+        """Returns the label code of an annotation type, registers it if it is not painted yet"""
+        if type_name not in self.type_names:
+            self.type_names.append(type_name)
+        return self.type_names.index(type_name) + 1
+
+    def remove_empty_cells(self, non_empty_mask: np.ndarray):
+        """Removes the labels of all cells that are empty according to the occupancy grid"""
+        height, width = self.labels.shape
+        occupied = np.zeros((height, width), dtype=bool)
+        mask = non_empty_mask[self.top:self.top + height, self.left:self.left + width]
+        occupied[:mask.shape[0], :mask.shape[1]] = mask
+        self.labels[~occupied] = NO_LABEL
+
+    def copy(self):
+        return LabelGrid(self.labels.copy(), self.annotated_rows, self.top, self.left, list(self.type_names))
+
+    @staticmethod
+    def paint(flat_lrs: Dict[str, Dict]) -> Optional["LabelGrid"]:
+        """Paints the flattened label regions into a grid.
+        Returns None if annotations overlap, as a grid can not hold more than one label per cell"""
+        type_names = []
+        rectangles = []
+        for region_data in flat_lrs.values():
+            if region_data["type"] not in type_names:
+                type_names.append(region_data["type"])
+            min_x, min_y = region_data['top_lx']
+            max_x, max_y = region_data['bot_rx']
+            rectangles.append((type_names.index(region_data["type"]) + 1, min_y, min_x, max_y, max_x))
+
+        if len(rectangles) == 0:
+            return LabelGrid(np.zeros((0, 0), dtype=np.int8), np.zeros(0, dtype=bool), 0, 0, type_names)
+
+        top = min([rectangle[1] for rectangle in rectangles])
+        left = min([rectangle[2] for rectangle in rectangles])
+        bottom = max([rectangle[3] for rectangle in rectangles])
+        right = max([rectangle[4] for rectangle in rectangles])
+
+        labels = np.zeros((bottom - top + 1, right - left + 1), dtype=np.int8)
+        coverage = np.zeros(labels.shape, dtype=np.int32)
+        for code, min_y, min_x, max_y, max_x in rectangles:
+            labels[min_y - top:max_y - top + 1, min_x - left:max_x - left + 1] = code
+            coverage[min_y - top:max_y - top + 1, min_x - left:max_x - left + 1] += 1
+        if (coverage > 1).any():
+            return None
+
+        return LabelGrid(labels, coverage.any(axis=1), top, left, type_names)
+
+
+def horizontal_runs(labels: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Run length encodes each row of a label grid. Returns row, start, stop (inclusive) and label code
+    of every run of equally labeled, adjacent cells, ordered by row and start"""
+    padded = np.pad(labels, ((0, 0), (1, 1)), constant_values=NO_LABEL)
+    # change[:, j] marks a label change between column j - 1 and column j
+    change = padded[:, 1:] != padded[:, :-1]
+    labeled = labels != NO_LABEL
+    rows, starts = np.nonzero(change[:, :-1] & labeled)
+    _, stops = np.nonzero(change[:, 1:] & labeled)
+    return rows, starts, stops, labels[rows, starts]
+
+
+def merge_runs_into_lrs(
+        row_top: np.ndarray,
+        row_bottom: np.ndarray,
+        y_top: np.ndarray,
+        y_bottom: np.ndarray,
+        starts: np.ndarray,
+        stops: np.ndarray,
+        codes: np.ndarray,
+        type_names: List[str],
+) -> List[LabelRegion]:
+    """Merges vertically adjacent runs with the same label and bounds into label regions.
+    A run spans the rows row_top to row_bottom of the list of rows taking part in the merge,
+    which are the sheet rows y_top to y_bottom. Runs must be ordered by row_top and start.
+    Label region ids are assigned in order of their top-most run, like the cell based algorithm does"""
+    run_count = len(starts)
+    if run_count == 0:
+        return []
+    row_top, row_bottom = np.asarray(row_top, dtype=np.int64), np.asarray(row_bottom, dtype=np.int64)
+    starts, stops, codes = (np.asarray(a, dtype=np.int64) for a in (starts, stops, codes))
+
+    # Encode the bounds and label of a run, a run continues in the run of the next row with the same key
+    width = int(stops.max()) + 2
+    key_range = width * width * (len(type_names) + 1)
+    keys = (starts * width + stops) * (len(type_names) + 1) + codes
+    positions = row_top * key_range + keys
+    order = np.argsort(positions, kind="stable")
+    sorted_positions = positions[order]
+
+    wanted = (row_bottom + 1) * key_range + keys
+    candidates = np.minimum(np.searchsorted(sorted_positions, wanted), run_count - 1)
+    has_next = sorted_positions[candidates] == wanted
+    next_run = np.where(has_next, order[candidates], -1)
+
+    previous_run = np.full(run_count, -1, dtype=np.int64)
+    previous_run[next_run[has_next]] = np.nonzero(has_next)[0]
+
+    # Find the top-most run of each chain by pointer jumping
+    heads = previous_run == -1
+    root = np.where(heads, np.arange(run_count), previous_run)
+    while True:
+        jumped = root[root]
+        if (jumped == root).all():
+            break
+        root = jumped
+
+    lr_ids = np.cumsum(heads) - 1
+    run_lr_ids = lr_ids[root]
+    bottoms = np.full(int(heads.sum()), -1, dtype=np.int64)
+    np.maximum.at(bottoms, run_lr_ids, np.asarray(y_bottom, dtype=np.int64))
+
+    lrs = []
+    for head in np.nonzero(heads)[0].tolist():
+        lr_id = int(lr_ids[head])
+        # Annotations are 0-index, but openpyxl indexes like excel, starting at 1
+        lrs.append(LabelRegion(
+            lr_id,
+            LabelRegionType(type_names[codes[head] - 1]),
+            int(y_top[head]) + 1,
+            int(starts[head]) + 1,
+            int(bottoms[lr_id]) + 1,
+            int(stops[head]) + 1,
+        ))
+    return lrs
+
+
+def lrs_from_grid(grid: LabelGrid, present_rows: np.ndarray) -> List[LabelRegion]:
+    """Derives label regions from a painted grid. Only present rows take part in the vertical merge,
+    rows that are not present are skipped as if they did not exist"""
+    present_row_indices = np.nonzero(present_rows)[0]
+    rows, starts, stops, codes = horizontal_runs(grid.labels[present_row_indices])
+    ys = present_row_indices[rows] + grid.top
+    return merge_runs_into_lrs(rows, rows, ys, ys, starts + grid.left, stops + grid.left, codes, grid.type_names)
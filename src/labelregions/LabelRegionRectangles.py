@@ -0,0 +1,203 @@
+"""Rectangle based derivation of label regions from annotations.
+Produces the same label regions as the cell based algorithm of the LabelRegionLoader, but never touches single cells.
+Rows are grouped into bands, in which every row has the same annotations and the same empty cells.
+Work and memory scale with the number of annotation rectangles and empty-cell runs, not with the number of cells"""
+import logging
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from labelregions.LabelRegion import LabelRegion
+from labelregions.LabelRegionRaster import merge_runs_into_lrs
+from labelregions.OccupancyIndex import OccupancyIndex
+
+logger = logging.getLogger(__name__)
+
+
+class RowBand(object):
+    """Consecutive sheet rows y_top to y_bottom, whose cells are labeled alike"""
+
+    def __init__(self, y_top: int, y_bottom: int, pieces: List[List[int]]):
+        self.y_top = y_top
+        self.y_bottom = y_bottom
+        # [start, stop, code] of labeled cell intervals of each row, ordered by start, stop is inclusive
+        self.pieces = pieces
+
+    @property
+    def height(self) -> int:
+        return self.y_bottom - self.y_top + 1
+
+    @property
+    def cells_per_row(self) -> int:
+        return sum([stop - start + 1 for start, stop, _ in self.pieces])
+
+    def split(self, y: int) -> Tuple[Optional["RowBand"], "RowBand", Optional["RowBand"]]:
+        """Splits the band into the rows above y, row y and the rows below y"""
+        above, below = None, None
+        if y > self.y_top:
+            above = RowBand(self.y_top, y - 1, [list(piece) for piece in self.pieces])
+        if y < self.y_bottom:
+            below = RowBand(y + 1, self.y_bottom, [list(piece) for piece in self.pieces])
+        return above, RowBand(y, y, [list(piece) for piece in self.pieces]), below
+
+    def relabel(self, x: int, code: Optional[int]):
+        """Relabels the cell at column x of a single row band, omits it if code is None"""
+        for i, (start, stop, old_code) in enumerate(self.pieces):
+            if start <= x <= stop:
+                replacement = []
+                if start < x:
+                    replacement.append([start, x - 1, old_code])
+                if code is not None:
+                    replacement.append([x, x, code])
+                if x < stop:
+                    replacement.append([x + 1, stop, old_code])
+                self.pieces[i:i + 1] = replacement
+                return
+
+    def sequences(self) -> List[List[int]]:
+        """Merges adjacent pieces of the same label into sequences, like neighbouring cells are merged"""
+        sequences = []
+        for start, stop, code in self.pieces:
+            if len(sequences) > 0 and sequences[-1][1] + 1 == start and sequences[-1][2] == code:
+                sequences[-1][1] = stop
+            else:
+                sequences.append([start, stop, code])
+        return sequences
+
+
+class RectangleBands(object):
+    """Annotation rectangles of a sheet, cut into row bands"""
+
+    def __init__(self, bands: List[RowBand], type_names: List[str]):
+        # Bands of annotated rows, ordered by y, rows without annotation are not part of any band
+        self.bands = bands
+        # Label code - 1 to annotation type
+        self.type_names = type_names
+
+    def code_of(self, type_name: str) -> int:
+        """Returns the label code of an annotation type, registers it if it is not used yet"""
+        if type_name not in self.type_names:
+            self.type_names.append(type_name)
+        return self.type_names.index(type_name) + 1
+
+    @staticmethod
+    def from_rectangles(flat_lrs: Dict[str, Dict], occupancy_index: Optional[OccupancyIndex]) -> \
+            Optional["RectangleBands"]:
+        """Cuts the flattened label regions into row bands, without the cells the occupancy index marks as empty.
+        Pass None as index to keep empty cells. Returns None if annotations overlap"""
+        type_names = []
+        rectangles = []
+        for region_data in flat_lrs.values():
+            if region_data["type"] not in type_names:
+                type_names.append(region_data["type"])
+            min_x, min_y = region_data['top_lx']
+            max_x, max_y = region_data['bot_rx']
+            if min_x > max_x or min_y > max_y:
+                continue
+            rectangles.append((type_names.index(region_data["type"]) + 1, min_y, min_x, max_y, max_x))
+        if len(rectangles) == 0:
+            return RectangleBands([], type_names)
+
+        codes, tops, lefts, bottoms, rights = (np.array(values, dtype=np.int64) for values in zip(*rectangles))
+        overlap = (
+                (tops[:, None] <= bottoms[None, :]) & (tops[None, :] <= bottoms[:, None])
+                & (lefts[:, None] <= rights[None, :]) & (lefts[None, :] <= rights[:, None])
+        )
+        if np.count_nonzero(overlap) > len(rectangles):
+            return None
+
+        # Bands start wherever a rectangle starts or ends, or the empty cells within a rectangle change
+        breaks = set(tops.tolist()) | set((bottoms + 1).tolist())
+        if occupancy_index is not None:
+            for top, left, bottom, right in zip(tops.tolist(), lefts.tolist(), bottoms.tolist(), rights.tolist()):
+                rows = occupancy_index.rows_with_empty_cells(top, bottom, left, right)
+                breaks.update(rows.tolist())
+                breaks.update((rows + 1).tolist())
+                if top < occupancy_index.height <= bottom:
+                    breaks.add(occupancy_index.height)
+        breaks = sorted(breaks)
+
+        # Sweep over the bands, keeping track of the rectangles that cover them
+        by_top = np.argsort(tops, kind="stable").tolist()
+        next_rectangle = 0
+        active = []
+        bands = []
+        for y_top, y_next in zip(breaks[:-1], breaks[1:]):
+            active = [i for i in active if bottoms[i] >= y_top]
+            while next_rectangle < len(by_top) and tops[by_top[next_rectangle]] <= y_top:
+                active.append(by_top[next_rectangle])
+                next_rectangle += 1
+            if len(active) == 0:
+                continue
+
+            pieces = []
+            for i in sorted(active, key=lambda j: lefts[j]):
+                left, right, code = int(lefts[i]), int(rights[i]), int(codes[i])
+                if occupancy_index is None:
+                    pieces.append([left, right, code])
+                else:
+                    pieces.extend([start, stop, code] for start, stop in
+                                  occupancy_index.non_empty_pieces(y_top, left, right))
+            bands.append(RowBand(y_top, y_next - 1, pieces))
+
+        return RectangleBands(bands, type_names)
+
+    def copy(self):
+        return RectangleBands(
+            [RowBand(band.y_top, band.y_bottom, [list(piece) for piece in band.pieces]) for band in self.bands],
+            list(self.type_names),
+        )
+
+    def locate_cell(self, i: int, cell_offsets: List[int]) -> Tuple[int, int, int]:
+        """Returns band index, y and x of the i-th labeled cell, counted row by row and left to right"""
+        band_index = bisect_right(cell_offsets, i) - 1
+        band = self.bands[band_index]
+        row_offset, x_offset = divmod(i - cell_offsets[band_index], band.cells_per_row)
+        for start, stop, _ in band.pieces:
+            if x_offset <= stop - start:
+                return band_index, band.y_top + row_offset, start + x_offset
+            x_offset -= stop - start + 1
+        raise IndexError(i)
+
+    def cell_offsets(self) -> List[int]:
+        """Returns the number of labeled cells before each band, followed by the total number of labeled cells"""
+        offsets = [0]
+        for band in self.bands:
+            offsets.append(offsets[-1] + band.height * band.cells_per_row)
+        return offsets
+
+    def relabel_cells(self, relabels: List[Tuple[int, int, Optional[int]]]):
+        """Applies (y, x, code) relabels, code None omits the cell. Cut out rows are bands of their own"""
+        for y, x, code in relabels:
+            band_index = [band.y_top <= y <= band.y_bottom for band in self.bands].index(True)
+            above, row, below = self.bands[band_index].split(y)
+            row.relabel(x, code)
+            self.bands[band_index:band_index + 1] = [band for band in (above, row, below) if band is not None]
+
+    def label_of(self, band_index: int, x: int) -> str:
+        """Returns the annotation type of the cell at column x within the given band"""
+        for start, stop, code in self.bands[band_index].pieces:
+            if start <= x <= stop:
+                return self.type_names[code - 1]
+        raise IndexError(x)
+
+    def lrs(self, skip_empty_rows: bool) -> List[LabelRegion]:
+        """Merges the sequences of all bands into label regions. Rows without labeled cells break the vertical merge,
+        unless skip_empty_rows is set, then they are skipped as if they did not exist"""
+        row_top, row_bottom, y_top, y_bottom, starts, stops, codes = [], [], [], [], [], [], []
+        present_rows = 0
+        for band in self.bands:
+            sequences = band.sequences()
+            if skip_empty_rows and len(sequences) == 0:
+                continue
+            for start, stop, code in sequences:
+                row_top.append(present_rows)
+                row_bottom.append(present_rows + band.height - 1)
+                y_top.append(band.y_top)
+                y_bottom.append(band.y_bottom)
+                starts.append(start)
+                stops.append(stop)
+                codes.append(code)
+            present_rows += band.height
+        return merge_runs_into_lrs(row_top, row_bottom, y_top, y_bottom, starts, stops, codes, self.type_names)
@@ -0,0 +1,61 @@
+"""Sparse index of the empty cells of a sheet"""
+from typing import List, Tuple
+
+import numpy as np
+
+from labelregions.LabelRegionRaster import horizontal_runs
+
+
+class OccupancyIndex(object):
+    """Stores the empty cells of a sheet's used range as runs per row.
+    Cells right of or below the used range are empty as well, without being stored"""
+
+    def __init__(self, rows: np.ndarray, starts: np.ndarray, stops: np.ndarray, height: int, width: int):
+        # Runs of empty cells, ordered by row and start, coords start at zero
+        self.rows = rows
+        self.starts = starts
+        self.stops = stops
+        self.height = height
+        self.width = width
+
+    @staticmethod
+    def from_grid(non_empty_mask: np.ndarray):
+        """Creates the index from an occupancy grid"""
+        height, width = non_empty_mask.shape
+        rows, starts, stops, _ = horizontal_runs((~non_empty_mask).astype(np.int8))
+        return OccupancyIndex(rows, starts, stops, height, width)
+
+    def _runs_in_rows(self, top: int, bottom: int) -> slice:
+        """Returns the slice of all runs within the given rows"""
+        return slice(
+            int(np.searchsorted(self.rows, top, side="left")),
+            int(np.searchsorted(self.rows, bottom, side="right")),
+        )
+
+    def rows_with_empty_cells(self, top: int, bottom: int, left: int, right: int) -> np.ndarray:
+        """Returns all rows of the used range between top and bottom that have an empty cell between left and right.
+        Rows below and columns right of the used range are uniformly empty and not reported"""
+        runs = self._runs_in_rows(top, bottom)
+        intersecting = (self.starts[runs] <= right) & (self.stops[runs] >= left)
+        return np.unique(self.rows[runs][intersecting])
+
+    def non_empty_pieces(self, y: int, left: int, right: int) -> List[Tuple[int, int]]:
+        """Returns the intervals of non-empty cells of row y between left and right (inclusive)"""
+        if y >= self.height or left >= self.width:
+            return []
+        right = min(right, self.width - 1)
+        runs = self._runs_in_rows(y, y)
+
+        pieces = []
+        x = left
+        for start, stop in zip(self.starts[runs].tolist(), self.stops[runs].tolist()):
+            if stop < x:
+                continue
+            if start > right:
+                break
+            if start > x:
+                pieces.append((x, start - 1))
+            x = stop + 1
+        if x <= right:
+            pieces.append((x, right))
+        return pieces
@@ -11,6 +11,7 @@ from experiments import DataRefiner
 from experiments.CrossValidationTraining import CrossValidationTraining
 from experiments.ImprovedCrossValidationTraining import ImprovedCrossValidationTraining
 from labelregions.LabelRegionLoader import LabelRegionLoader
+from search.MetricStore import MetricStore
 
 logging.basicConfig(level=logging.INFO, stream=sys.stderr)
 
@@ -41,12 +42,17 @@ def main():
                             "EdgeMutationProbabilityExtreme",
                             "AvgDegreeCut"
                         ])
+    parser.add_argument("--processes", help="Number of processes used for preprocessing", type=int, default=1)
+    parser.add_argument("--metric-store", default=None,
+                        help="SQLite file to share metric values with other runs, disabled if not given")
     args = parser.parse_args()
 
     dataset = datasets[args.dataset]
 
-    data_preprocessor = DataPreprocessor(DATA_DIR, "preprocessed_annotations_elements.json")
+    data_preprocessor = DataPreprocessor(DATA_DIR, "preprocessed_annotations_elements.json", processes=args.processes)
     data_preprocessor.preprocess(dataset.name)
+    # Parse every workbook once, all later loads are served from the feature cache
+    dataset.build_feature_cache()
 
     DataRefiner.refine(dataset)
 
@@ -69,6 +75,8 @@ def main():
     else:
         raise ValueError("Unknown Improvement Chosen!")
 
+    metric_store = MetricStore(args.metric_store) if args.metric_store is not None else None
+
     experiment = experiment_class(
         dataset,
         label_region_loader,
@@ -76,8 +84,11 @@ def main():
         improvement_name=args.improvement,
         random_seed=args.seed,
         edge_mutation_probability_callback=edge_probability_callback,
+        metric_store=metric_store,
     )
     experiment.start()
+    if metric_store is not None:
+        metric_store.close()
 
 
 if __name__ == "__main__":
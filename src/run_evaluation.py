@@ -30,6 +30,8 @@ command = " ".join([
     "{noise}",
     "--seed {seed}",
     "--improvement {improvement}",
+    # All runs share the metric values of the sheets
+    "--metric-store output/metric_store.sqlite",
     "2> {log_file} &",
 ])
 
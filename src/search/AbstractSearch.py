@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 from typing import List
 
+from graph.Partition import Partition
 from graph.SpreadSheetGraph import SpreadSheetGraph
 from search.FitnessRater import FitnessRater
 
@@ -15,11 +16,16 @@ class AbstractSearch(ABC):
         self.rater = rater
 
     @abstractmethod
-    def run(self) -> SpreadSheetGraph:
+    def run(self) -> Partition:
+        """Searches the fittest partition of the graph, the graph itself is left unchanged"""
         pass
 
     def rate_edge_toggle_list(self, edge_toggle_list: List[bool]):
-        return self.rater.rate(self.graph, edge_toggle_list)
+        return self.rater.rate(self.graph.partition(edge_toggle_list))
+
+    def rate_edge_toggle_list_with_bound(self, edge_toggle_list: List[bool], bound: float):
+        """Rates exactly within the bound, see `FitnessRater.rate_with_bound`"""
+        return self.rater.rate_with_bound(self.graph.partition(edge_toggle_list), bound)
 
     @staticmethod
     def str_toggle_list(toggle_list):
@@ -0,0 +1,106 @@
+"""Metric values of the distinct components of graphs"""
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+
+class ComponentFeatureTable(object):
+    """One row of metric values per distinct component, components are identified by their graph id and node bitmask.
+    Holds at most max_rows rows (None for no limit), evicting the least recently used components.
+    Rows never change while their component is in the table, only the weights they are multiplied with do.
+    Rows of evicted components are reused, so rows must not be kept across calls that may add components"""
+
+    def __init__(self, feature_count: int, max_rows: Optional[int] = 1_000_000):
+        if max_rows is not None and max_rows < 1:
+            raise ValueError("A feature table needs room for at least one row")
+        self.max_rows = max_rows
+        self._row_of_component: "OrderedDict[Tuple[str, int], int]" = OrderedDict()
+        self._node_masks_per_graph: Dict[str, Set[int]] = {}
+        self._free_rows: List[int] = []
+        self._row_count = 0
+        self._features = np.zeros((16, feature_count), dtype=np.float64)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def features(self) -> np.ndarray:
+        """[row, feature] values of all rows in use, rows of evicted components are left in place until reused"""
+        return self._features[:self._row_count]
+
+    def preload(self, graph_id: str, features_of_components: Dict[int, Sequence[float]]):
+        """Adds the given features of a graph by component node mask, components already in the table are kept.
+        Misses are not counted"""
+        for node_mask, features in features_of_components.items():
+            if (graph_id, node_mask) not in self._row_of_component:
+                self._add(graph_id, node_mask, features)
+
+    def find(self, graph_id: str, node_mask: int) -> Optional[int]:
+        """Returns the row of a component, None if it is not in the table. Misses are not counted"""
+        entry_key = (graph_id, node_mask)
+        row = self._row_of_component.get(entry_key, None)
+        if row is not None:
+            self.hits += 1
+            self._row_of_component.move_to_end(entry_key)
+        return row
+
+    def row_of(self, graph_id: str, node_mask: int, features: Callable[[], Sequence[float]]) -> int:
+        """Returns the row of a component, calculates its features if it is not in the table yet"""
+        row = self.find(graph_id, node_mask)
+        if row is None:
+            self.misses += 1
+            row = self._add(graph_id, node_mask, features())
+        return row
+
+    def features_of(self, graph_id: str, node_mask: int, features: Callable[[], Sequence[float]]) -> np.ndarray:
+        """Returns a copy of the features of a component, see `row_of`. The copy stays valid when rows are reused"""
+        row = self.row_of(graph_id, node_mask, features)
+        return self._features[row].copy()
+
+    def _add(self, graph_id: str, node_mask: int, features: Sequence[float]) -> int:
+        """Adds the features of a component to a free row and returns the row"""
+        if self.max_rows is not None and len(self._row_of_component) >= self.max_rows:
+            self._evict()
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = self._row_count
+            self._row_count += 1
+            if row == len(self._features):
+                # Grow geometrically, so appending rows stays cheap
+                self._features = np.concatenate([self._features, np.zeros_like(self._features)])
+        self._features[row] = features
+        self._row_of_component[(graph_id, node_mask)] = row
+        self._node_masks_per_graph.setdefault(graph_id, set()).add(node_mask)
+        return row
+
+    def _evict(self):
+        """Drops the least recently used component, its row is reused"""
+        (graph_id, node_mask), row = self._row_of_component.popitem(last=False)
+        graph_node_masks = self._node_masks_per_graph[graph_id]
+        graph_node_masks.discard(node_mask)
+        if len(graph_node_masks) == 0:
+            del self._node_masks_per_graph[graph_id]
+        self._free_rows.append(row)
+        self.evictions += 1
+
+    def drop_graph(self, graph_id: str) -> int:
+        """Drops all components of a graph, returns the number of dropped components"""
+        graph_node_masks = self._node_masks_per_graph.pop(graph_id, set())
+        for node_mask in graph_node_masks:
+            self._free_rows.append(self._row_of_component.pop((graph_id, node_mask)))
+        return len(graph_node_masks)
+
+    def statistics(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._row_of_component),
+            "graphs": len(self._node_masks_per_graph),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._row_of_component)
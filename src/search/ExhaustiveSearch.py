@@ -1,6 +1,9 @@
-"""Implements genetic search on SpreadsheetGraphs"""
+"""Implements exhaustive search on SpreadsheetGraphs"""
 import logging
+import math
 
+from graph.ConnectedPartitions import ConnectedPartitions
+from graph.Partition import Partition
 from search.AbstractSearch import AbstractSearch
 
 logger = logging.getLogger(__name__)
@@ -8,30 +11,24 @@ logger = logging.getLogger(__name__)
 
 class ExhaustiveSearch(AbstractSearch):
 
-    def run(self):
-        """Iterate through all possible edge permutations via binary encoding"""
+    def run(self) -> Partition:
+        """Iterate through all partitions of the nodes into connected components, each rated once"""
         logger.debug("Running Exhaustive Search...")
-        bits = len(self.graph.edge_toggle_list)
-        numbers = 2 ** bits
+        connected_partitions = ConnectedPartitions(self.graph)
 
         fittest_partition = None
         fittest_rating = None
-        for n in range(numbers):
-            # Map binary representation of permutation to toggle list
-            bitstring = bin(n)[2:]
-            missing_bits = bits - len(bitstring)
-            # Prefix with zeros to fit the required length
-            bitstring = "0" * missing_bits + bitstring
-            # Transform 0 to false and 1 to true
-            toggle_list = [bool(int(bit)) for bit in bitstring]
-
-            # Calculate rating
-            rating = self.rate_edge_toggle_list(toggle_list)
+        for components in connected_partitions:
+            partition = connected_partitions.partition(components)
+            # Calculate rating, partitions worse than the fittest one so far are rejected early
+            rating = self.rater.rate_with_bound(
+                partition,
+                fittest_rating if fittest_rating is not None else math.inf,
+            )
             if fittest_rating is None or rating < fittest_rating:
                 fittest_rating = rating
-                fittest_partition = toggle_list
+                fittest_partition = partition
 
-        logger.debug(f"Best individual: {fittest_partition}")
+        logger.debug(f"Best partition: {fittest_partition}")
         logger.debug(f"Best rating: {fittest_rating}")
-        self.graph.edge_toggle_list = fittest_partition
-        return self.graph
+        return fittest_partition
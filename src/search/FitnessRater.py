@@ -1,31 +1,40 @@
 """Class which implements Metrics and Weight Training for Partition Evaluation"""
 import logging
-from itertools import chain
-from typing import List, Callable, Dict
+from typing import List, Callable, Dict, Optional, Set, Tuple
 
-from openpyxl.utils import get_column_letter
-from openpyxl.worksheet.worksheet import Worksheet
+import numpy as np
 
+from graph.CompactGraph import popcount, mask_runs
 from graph.GraphComponentData import GraphComponentData
+from graph.Partition import Partition
 from graph.SpreadSheetGraph import SpreadSheetGraph
 from labelregions.BoundingBox import BoundingBox
+from search.ComponentFeatureTable import ComponentFeatureTable
+from search.MetricStore import MetricStore
+from search.ScoreCache import ScoreCache
 
 logger = logging.getLogger(__name__)
 
+# Default number of entries of each score cache of a rater
+DEFAULT_CACHE_SIZE = 1_000_000
+
+# Bump whenever a component based metric changes, values of older versions in a metric store are ignored
+METRIC_VERSION = 1
+
 
 # logger.setLevel(logging.DEBUG)
 
 
 def ndar(component: GraphComponentData) -> float:
-    if len(component.c_d) < 1 or len(component.c_ht) < 1:
+    if component.c_d_mask == 0 or component.c_ht_mask == 0:
         return 0
-    return 1 - len(component.c_d.intersection(component.c_ht)) / len(component.c_d)
+    return 1 - popcount(component.c_d_mask & component.c_ht_mask) / popcount(component.c_d_mask)
 
 
 def nhar(component: GraphComponentData) -> float:
-    if len(component.c_d) < 1 or len(component.c_ht) < 1:
+    if component.c_d_mask == 0 or component.c_ht_mask == 0:
         return 0
-    return 1 - len(component.c_d.intersection(component.c_ht)) / len(component.c_ht)
+    return 1 - popcount(component.c_d_mask & component.c_ht_mask) / popcount(component.c_ht_mask)
 
 
 def dp(component: GraphComponentData) -> float:
@@ -42,9 +51,9 @@ def hp(component: GraphComponentData) -> float:
 
 def ioc(component: GraphComponentData) -> float:
     if (
-            len(component.c_d) == 1 and
-            len(component.c_ht) == 1 and
-            len(component.c_d.intersection(component.c_ht)) == 1
+            popcount(component.c_d_mask) == 1 and
+            popcount(component.c_ht_mask) == 1 and
+            popcount(component.c_d_mask & component.c_ht_mask) == 1
     ):
         return 1
     return 0
@@ -56,9 +65,7 @@ def ovh(component: GraphComponentData) -> float:
         if header_group == component.header_top:
             # We are looking for other valid header groups than header top
             continue
-        x_lists = [lr.get_all_x() for lr in header_group]
-        x_s = set(list(chain(*x_lists)))
-        if len(x_s) >= 2:
+        if popcount(component.column_mask_of(header_group)) >= 2:
             ovh.append(header_group)
     return len(ovh)
 
@@ -89,110 +96,67 @@ def dahr(component: GraphComponentData) -> float:
 
 
 def avg_waec(component: GraphComponentData) -> float:
-    x_lists = [lr.get_all_x() for lr in component.label_regions]
-    # All columns that are covered by at least on label region in our component
-    x_s = set(list(chain(*x_lists)))
     # The Columns most left and most right in our component can not be empty
     # otherwise the component would be smaller
-    # This means all columns in the components bounding box without x_s are all empty columns
-    empty_columns = set(component.bounding_box.get_all_x()) - x_s
-
-    # Group of adj empty columns
-    group = []
-    # List of groups
-    c_emt = []
-    for col_index in sorted(empty_columns):
-        if len(group) == 0:
-            group = [col_index]
-            continue
-        if col_index - 1 != group[-1]:
-            # column not left adj of last col in current group
-            c_emt.append(group)
-            group = [col_index]
-
-        group.append(col_index)
-    # The group contains tha last index. That index can not be followed by a gap, because its the end
-    # Append that last group
-    c_emt.append(group)
-
-    if len(c_emt) == 0:
+    # This means all columns in the components bounding box not covered by a label region are all empty columns
+    empty_columns = component.bounding_box_column_mask & ~component.column_mask
+    if empty_columns == 0:
         # Assumption: The metric lacks handling of missing empty columns, which would lead to division by zero
         # We will return 0 (the best possible score) if there are no empty columns
         return 0
 
-    # Groups not necessary for total width of empty columns, just iterate over all empty columns
-    total_width = 0
-    for empty_column in empty_columns:
-        width = component.graph.sheet.column_dimensions[get_column_letter(empty_column)].width
-        if width is None:
-            # Dimensions are None if default values are used
-            width = component.graph.sheet.sheet_format.defaultColWidth
-        total_width += width
-
-    return total_width / len(c_emt)
+    # Groups of adjacent empty columns
+    starts, stops = mask_runs(empty_columns)
+    origin = component.graph.compact.column_origin
+    total_width = component.graph.geometry.column_span_widths(starts + origin, stops + origin).sum()
+    return float(total_width) / len(starts)
 
 
 def avg_waer(component: GraphComponentData) -> float:
-    y_lists = [lr.get_all_y() for lr in component.label_regions]
-    # All rows that are covered by at least on label region in our component
-    y_s = set(list(chain(*y_lists)))
     # The Rows most top and most bottom in our component can not be empty
     # otherwise the component would be smaller
-    # This means all rows in the components bounding box without y_s are all empty columns
-    empty_rows = set(component.bounding_box.get_all_y()) - y_s
-    # Group of adj empty rows
-    group = []
-    # List of groups
-    r_emt = []
-    for row_index in sorted(empty_rows):
-        if len(group) == 0:
-            group = [row_index]
-            continue
-        if row_index - 1 != group[-1]:
-            # row not below adj of last row in current group
-            r_emt.append(group)
-            group = [row_index]
-
-        group.append(row_index)
-    # The group contains tha last index. That index can not be followed by a gap, because its the end
-    # Append that last group
-    r_emt.append(group)
-
-    if len(r_emt) == 0:
+    # This means all rows in the components bounding box not covered by a label region are all empty rows
+    empty_rows = component.bounding_box_row_mask & ~component.row_mask
+    if empty_rows == 0:
         # Assumption: The metric lacks handling of missing empty rows, which would lead to division by zero
         # We will return 0 (the best possible score) if there are no empty rows
         return 0
 
-    # Groups not necessary for total height of empty rows, just iterate over all empty rows
-    total_height = 0
-    for empty_row in empty_rows:
-        height = component.graph.sheet.row_dimensions[empty_row].height
-        if height is None:
-            # Dimensions are None if default values are used
-            height = component.graph.sheet.sheet_format.defaultRowHeight
-        total_height += height
-    return total_height / len(r_emt)
+    # Groups of adjacent empty rows
+    starts, stops = mask_runs(empty_rows)
+    origin = component.graph.compact.row_origin
+    total_height = component.graph.geometry.row_span_heights(starts + origin, stops + origin).sum()
+    return float(total_height) / len(starts)
+
+
+def union_length(starts: np.ndarray, stops: np.ndarray) -> int:
+    """Returns the number of indices covered by at least one of the intervals starts to stops (inclusive)"""
+    if len(starts) == 0:
+        return 0
+    order = np.argsort(starts, kind="stable")
+    starts, stops = starts[order], stops[order]
+    covered_up_to = np.maximum.accumulate(stops)
+    previously_covered_up_to = np.concatenate([[starts[0] - 1], covered_up_to[:-1]])
+    # Each interval adds the indices past everything covered by the intervals starting before it
+    return int(np.maximum(covered_up_to - np.maximum(previously_covered_up_to, starts - 1), 0).sum())
 
 
 def ovr(components: List[GraphComponentData]) -> float:
     # Warning: This metric is really weird, as they use
     # len(cols_of_all_lrs) * len(rows_of_all_lrs) of all divisor, which does not make sense to me
-    overlap = 0
-    cols_of_all_lrs = []
-    rows_of_all_lrs = []
-    for i in range(len(components)):
-        c_i = set(components[i].bounding_box.get_all_x())
-        cols_of_all_lrs.extend(c_i)
-        r_i = set(components[i].bounding_box.get_all_y())
-        rows_of_all_lrs.extend(r_i)
-        for j in range(len(components)):
-            if j <= i:
-                continue
-            c_j = components[j].bounding_box.get_all_x()
-            r_j = components[j].bounding_box.get_all_y()
-
-            overlap += len(c_i.intersection(c_j)) * len(r_i.intersection(r_j))
-    return overlap / (len(set(cols_of_all_lrs)) * len(set(rows_of_all_lrs)))
+    boxes = np.array(
+        [[c.bounding_box.top, c.bounding_box.left, c.bounding_box.bottom, c.bounding_box.right] for c in components],
+        dtype=np.int64,
+    ).reshape(-1, 4)
+    tops, lefts, bottoms, rights = boxes.T
+
+    # Overlapping cols and rows of all pairs of components, counted once per pair
+    overlapping_cols = np.minimum(rights[:, None], rights[None, :]) - np.maximum(lefts[:, None], lefts[None, :]) + 1
+    overlapping_rows = np.minimum(bottoms[:, None], bottoms[None, :]) - np.maximum(tops[:, None], tops[None, :]) + 1
+    pair_overlap = np.maximum(overlapping_cols, 0) * np.maximum(overlapping_rows, 0)
+    overlap = int(np.triu(pair_overlap, k=1).sum())
+
+    return overlap / (union_length(lefts, rights) * union_length(tops, bottoms))
 
 
 COMPONENT_BASED_METRICS: List[Callable[[GraphComponentData], float]] = [
@@ -211,6 +175,33 @@ PARTITION_BASED_METRICS: List[Callable[[List[GraphComponentData]], float]] = [
     ovr,
 ]
 
+# Names of the component based metrics, as used by the metric store
+METRIC_NAMES: List[str] = [metric.__name__ for metric in COMPONENT_BASED_METRICS]
+
+# Order in which `rate_with_bound` calculates the component based metrics: cheap ones first, then the ones whose
+# values are large enough to exceed a bound quickly, the header group based ones last
+BOUND_METRIC_ORDER: List[Callable[[GraphComponentData], float]] = [
+    dp,
+    hp,
+    ndar,
+    nhar,
+    ioc,
+    avg_waec,
+    avg_waer,
+    dahr,
+    ovh,
+]
+
+# Partial ratings must exceed a bound by this relative margin to be rejected, so rounding never rejects a partition
+# whose exact rating is within the bound
+BOUND_TOLERANCE = 1e-9
+
+# Weight index of each partition based metric. Partition based metrics have always been weighted starting at the
+# last component based weight, kept so trained weight vectors stay valid
+PARTITION_METRIC_WEIGHT_INDICES: List[int] = [
+    len(COMPONENT_BASED_METRICS) - 1 + j for j in range(len(PARTITION_BASED_METRICS))
+]
+
 
 def weight_vector_length():
     """Returns the necessary length for a weight vector"""
@@ -228,7 +219,7 @@ def weight_lookup(weights):
         lookup[metric.__name__] = weights[i]
 
     for j, metric in enumerate(PARTITION_BASED_METRICS):
-        lookup[metric.__name__] = weights[len(COMPONENT_BASED_METRICS) - 1 + j]
+        lookup[metric.__name__] = weights[PARTITION_METRIC_WEIGHT_INDICES[j]]
     return lookup
 
 
@@ -242,81 +233,247 @@ def weights_from_lookup(lookup: Dict[str, float]):
 
 
 class FitnessRater(object):
-    def __init__(self, weights: List[float]):
-        # Cache from component & metric to score for component based metrics
-        self._component_score_cache: Dict[Worksheet, Dict[str, Dict[str, float]]] = {}
-        # Cache from components & metric to score for partition based metrics
-        self._partition_score_cache: Dict[Worksheet, Dict[str, Dict[str, float]]] = {}
+    def __init__(
+            self,
+            weights: List[float],
+            cache_size: Optional[int] = DEFAULT_CACHE_SIZE,
+            metric_store: Optional[MetricStore] = None,
+    ):
+        # Caches are keyed by the graph id instead of the graph, so they do not keep any sheet alive
+        # See `release` to drop the entries of a graph
+        # Component based metric values by graph id & component, holds at most cache_size rows (None for no limit)
+        self._feature_table = ComponentFeatureTable(len(COMPONENT_BASED_METRICS), cache_size)
+        # Graph ids whose components were preloaded from the metric store
+        self._preloaded_graphs: Set[str] = set()
+        # Cache from graph id, components & metric to score for partition based metrics, holds at most cache_size
+        # entries (None for no limit)
+        self._partition_score_cache = ScoreCache(cache_size)
+        # Memo from graph id & partition key to rating, cleared whenever the weights change
+        self._rating_memo = ScoreCache(cache_size)
+        # Partial ratings of partitions rejected by `rate_with_bound`, cleared whenever the weights change
+        self._rating_lower_bounds = ScoreCache(cache_size)
+        # Metric values of components that `rate_with_bound` did not rate completely, by graph id, node mask & metric
+        self._partial_features = ScoreCache(cache_size)
+        # Optional persistent store of component based metric values, shared with other runs
+        self.metric_store = metric_store
 
         if len(weights) != self.__class__.correct_weight_length():
             raise ValueError("Weight Vector not the correct size!")
         self.weights = weights
 
+    @property
+    def weights(self) -> List[float]:
+        return self._weights
+
+    @weights.setter
+    def weights(self, weights: List[float]):
+        self._weights = weights
+        self._weight_vector = np.asarray(weights, dtype=np.float64)
+        # Ratings depend on the weights, metric scores do not
+        self._rating_memo.clear()
+        self._rating_lower_bounds.clear()
+
     @staticmethod
     def correct_weight_length():
         return len(COMPONENT_BASED_METRICS) + len(PARTITION_BASED_METRICS)
 
+    def release(self, graph: SpreadSheetGraph):
+        """Drops all cached scores of a graph, call once the graph is not rated anymore"""
+        self._feature_table.drop_graph(graph.id)
+        self._preloaded_graphs.discard(graph.id)
+        caches = (self._partition_score_cache, self._rating_memo, self._rating_lower_bounds, self._partial_features)
+        for cache in caches:
+            cache.drop_graph(graph.id)
+
+    def cache_statistics(self) -> Dict[str, Dict[str, int]]:
+        """Returns entry counts and hit/miss/eviction counters of all caches"""
+        return {
+            "component_features": self._feature_table.statistics(),
+            "partition_scores": self._partition_score_cache.statistics(),
+            "ratings": self._rating_memo.statistics(),
+            "rating_lower_bounds": self._rating_lower_bounds.statistics(),
+            "partial_features": self._partial_features.statistics(),
+            "metric_store": self.metric_store.statistics() if self.metric_store is not None else {},
+        }
+
+    def _preload(self, graph_id: str):
+        """Adds the stored components of the graph to the feature table once, if there is a metric store"""
+        if self.metric_store is not None and graph_id not in self._preloaded_graphs:
+            self._preloaded_graphs.add(graph_id)
+            self._feature_table.preload(graph_id, self.metric_store.load_graph(graph_id, METRIC_NAMES, METRIC_VERSION))
+
+    def _component_feature_vector(
+            self,
+            graph_id: str,
+            component: GraphComponentData,
+            calculated: Optional[Dict[str, float]] = None,
+    ) -> np.ndarray:
+        """Returns the component based metric values of the given component.
+        Metric values that are already calculated can be passed by metric name"""
+        self._preload(graph_id)
+        return self._feature_table.features_of(
+            graph_id,
+            component.node_mask,
+            lambda: self._component_features(graph_id, component, calculated),
+        )
+
+    def _component_features(
+            self,
+            graph_id: str,
+            component: GraphComponentData,
+            calculated: Optional[Dict[str, float]] = None,
+    ) -> List[float]:
+        """Calculates all component based metrics of a component, adds them to the metric store if there is one"""
+        if calculated is None:
+            calculated = {}
+        features = [
+            calculated[metric.__name__] if metric.__name__ in calculated else metric(component)
+            for metric in COMPONENT_BASED_METRICS
+        ]
+        if self.metric_store is not None:
+            self.metric_store.put(graph_id, component.node_mask, dict(zip(METRIC_NAMES, features)), METRIC_VERSION)
+        return features
+
     def get_from_component_cache(
             self,
-            sheet: Worksheet,
+            graph_id: str,
             component: GraphComponentData,
             metric: Callable[[GraphComponentData], float],
     ) -> float:
-        component_id = component.id
-        metric_name = metric.__name__
-
-        if self._component_score_cache.get(sheet, None) is None:
-            # Sheet is not yet in cache
-            self._component_score_cache[sheet] = {}
-        if self._component_score_cache[sheet].get(component_id, None) is None:
-            # Component Id not yet in cache
-            self._component_score_cache[sheet][component_id] = {}
-        if self._component_score_cache[sheet][component_id].get(metric_name, None) is None:
-            # No metric score yet
-            self._component_score_cache[sheet][component_id][metric_name] = metric(component)
-        return self._component_score_cache[sheet][component_id][metric_name]
+        return float(self._component_feature_vector(graph_id, component)[COMPONENT_BASED_METRICS.index(metric)])
 
     def get_from_partition_cache(
             self,
-            sheet: Worksheet,
+            graph_id: str,
             components: List[GraphComponentData],
             metric: Callable[[List[GraphComponentData]], float],
     ):
-        partition_id = "-".join([component.id for component in components])
-        metric_name = metric.__name__
-
-        if self._partition_score_cache.get(sheet, None) is None:
-            # Sheet is not yet in cache
-            self._partition_score_cache[sheet] = {}
-        if self._partition_score_cache[sheet].get(partition_id, None) is None:
-            # Component Id not yet in cache
-            self._partition_score_cache[sheet][partition_id] = {}
-        if self._partition_score_cache[sheet][partition_id].get(metric_name, None) is None:
-            # No metric score yet
-            self._partition_score_cache[sheet][partition_id][metric_name] = metric(components)
-        return self._partition_score_cache[sheet][partition_id][metric_name]
-
-    def rate(self, graph: SpreadSheetGraph, edge_toggle_list: List[bool]) -> float:
-        """Rates a graph based on a edge toggle list"""
-        # Create graph copy and let it represent the partition
-
-        old_toggle_list = graph.edge_toggle_list
-        graph.edge_toggle_list = edge_toggle_list
-        components = [GraphComponentData(c, graph) for c in graph.get_components()]
-        graph.edge_toggle_list = old_toggle_list
-
-        scores_per_component = []
-        for component in components:
-            score = 0
-            for i, metric in enumerate(COMPONENT_BASED_METRICS):
-                metric_score = self.get_from_component_cache(graph.sheet, component, metric)
-                score += metric_score * self.weights[i]
-            scores_per_component.append(score)
-
-        scores_per_partition = []
-        for j, metric in enumerate(PARTITION_BASED_METRICS):
-            metric_score = self.get_from_partition_cache(graph.sheet, components, metric)
-            score = metric_score * self.weights[len(COMPONENT_BASED_METRICS) - 1 + j]
-            scores_per_partition.append(score)
+        # Component ids are canonical, sorting them makes the partition id independent of the component order
+        partition_id = "-".join(sorted([component.id for component in components]))
+        return self._partition_score_cache.get(graph_id, (partition_id, metric.__name__), lambda: metric(components))
 
-        return sum(scores_per_component) + sum(scores_per_partition)
+    @staticmethod
+    def components_of(partition: Partition) -> List[GraphComponentData]:
+        """Returns the components of a partition"""
+        return [GraphComponentData(c, partition.graph) for c in partition.get_components()]
+
+    def features_of_components(self, graph: SpreadSheetGraph, components: List[GraphComponentData]) -> np.ndarray:
+        """Returns the feature vector of the partition of a graph into the given components
+        The rating of the partition is the dot product of its feature vector and the weights"""
+        features = np.zeros(self.correct_weight_length(), dtype=np.float64)
+        if len(components) > 0:
+            # Copies of the rows, adding a component may reuse the row of another one
+            features[:len(COMPONENT_BASED_METRICS)] = np.sum(
+                [self._component_feature_vector(graph.id, component) for component in components],
+                axis=0,
+            )
+        for j, metric in enumerate(PARTITION_BASED_METRICS):
+            features[PARTITION_METRIC_WEIGHT_INDICES[j]] += self.get_from_partition_cache(graph.id, components, metric)
+        return features
+
+    def partition_features(self, partition: Partition) -> np.ndarray:
+        """Returns the feature vector of a partition, see `features_of_components`"""
+        return self.features_of_components(partition.graph, self.components_of(partition))
+
+    def rate(self, partition: Partition) -> float:
+        """Rates a partition of a graph
+        Partitions that were rated before are served from the rating memo"""
+        graph = partition.graph
+        return self._rating_memo.get(
+            graph.id,
+            partition.key,
+            lambda: self.rate_components(graph, self.components_of(partition)),
+        )
+
+    def rate_with_bound(self, partition: Partition, bound: float) -> float:
+        """Rates like `rate`, but stops as soon as the rating is known to exceed the bound.
+        Returns the exact rating if it is within the bound, otherwise a partial rating that exceeds the bound and is
+        never greater than the exact rating. All metrics are non negative, so with non negative weights every metric
+        value can only increase the rating. Rates exactly if any weight is negative"""
+        graph, partition_key = partition.graph, partition.key
+        rating = self._rating_memo.find(graph.id, partition_key)
+        if rating is not None:
+            return rating
+        rejection_threshold = bound + BOUND_TOLERANCE * max(1.0, abs(bound))
+        lower_bound = self._rating_lower_bounds.find(graph.id, partition_key)
+        if lower_bound is not None and lower_bound > rejection_threshold:
+            return lower_bound
+
+        components = self.components_of(partition)
+        if (self._weight_vector < 0).any():
+            return self._rating_memo.get(graph.id, partition_key, lambda: self.rate_components(graph, components))
+
+        # Components that were rated before contribute all their metrics at once
+        self._preload(graph.id)
+        table = self._feature_table
+        rows = [table.find(graph.id, component.node_mask) for component in components]
+        known_rows = [row for row in rows if row is not None]
+        unknown = [component for component, row in zip(components, rows) if row is None]
+        component_weights = self._weight_vector[:len(COMPONENT_BASED_METRICS)]
+        partial_rating = float(table.features[known_rows].sum(axis=0) @ component_weights) if known_rows else 0.0
+
+        # Metric values calculated by earlier rejected ratings are free, unless they were evicted since
+        calculated: List[Dict[str, float]] = []
+        for component in unknown:
+            metric_values = {}
+            for i, name in enumerate(METRIC_NAMES):
+                value = self._partial_features.find(graph.id, (component.node_mask, name))
+                if value is not None:
+                    metric_values[name] = value
+                    partial_rating += self._weight_vector[i] * value
+            calculated.append(metric_values)
+
+        # Metrics of the other components one at a time, until the partial rating exceeds the bound
+        for metric in BOUND_METRIC_ORDER:
+            if partial_rating > rejection_threshold:
+                self._rating_lower_bounds.put(graph.id, partition_key, partial_rating)
+                for component, metric_values in zip(unknown, calculated):
+                    for name, value in metric_values.items():
+                        self._partial_features.put(graph.id, (component.node_mask, name), value)
+                return partial_rating
+            weight = self._weight_vector[COMPONENT_BASED_METRICS.index(metric)]
+            for component, metric_values in zip(unknown, calculated):
+                if metric.__name__ not in metric_values:
+                    metric_values[metric.__name__] = metric(component)
+                    partial_rating += weight * metric_values[metric.__name__]
+
+        # All component metrics are known, the partition based ones are added in the exact rating
+        for component, metric_values in zip(unknown, calculated):
+            self._component_feature_vector(graph.id, component, metric_values)
+            for name in METRIC_NAMES:
+                self._partial_features.discard(graph.id, (component.node_mask, name))
+        return self._rating_memo.get(graph.id, partition_key, lambda: self.rate_components(graph, components))
+
+    def component_rating(self, graph: SpreadSheetGraph, component: GraphComponentData) -> float:
+        """Returns the weighted sum of the component based metrics of a single component"""
+        features = self._component_feature_vector(graph.id, component)
+        return float(features @ self._weight_vector[:len(COMPONENT_BASED_METRICS)])
+
+    def component_count_rating(self, graph: SpreadSheetGraph, component_count: int) -> float:
+        """Returns the weighted part of the rating that depends on nothing but the number of components"""
+        return 0.0
+
+    def memoized_rating(self, graph: SpreadSheetGraph, partition_key: Tuple[int, ...], rate: Callable[[], float]) -> \
+            float:
+        """Returns the memoized rating of a partition, memoizes the given rating on a miss"""
+        return self._rating_memo.get(graph.id, partition_key, rate)
+
+    def rate_batch(self, partitions: List[Partition]) -> np.ndarray:
+        """Rates many partitions with a single matrix product, each distinct partition is featurized once"""
+        rows_of_partitions: Dict[Partition, int] = {}
+        partition_rows = []
+        features = []
+        for partition in partitions:
+            if partition not in rows_of_partitions:
+                rows_of_partitions[partition] = len(features)
+                features.append(self.partition_features(partition))
+            partition_rows.append(rows_of_partitions[partition])
+
+        if len(features) == 0:
+            return np.zeros(0, dtype=np.float64)
+        ratings = np.stack(features) @ self._weight_vector
+        return ratings[partition_rows]
+
+    def rate_components(self, graph: SpreadSheetGraph, components: List[GraphComponentData]) -> float:
+        """Rates the partition of a graph into the given components"""
+        return float(self.features_of_components(graph, components) @ self._weight_vector)
@@ -2,18 +2,36 @@
 import logging
 import math
 import random
-from typing import List, Tuple
+from typing import List, Optional
 
+from graph.Partition import Partition
 from graph.SpreadSheetGraph import SpreadSheetGraph
 from search.AbstractSearch import AbstractSearch
 from search.FitnessRater import FitnessRater
 from search.GeneticSearchConfiguration import GeneticSearchConfiguration
+from search.IncrementalEvaluator import IncrementalEvaluator
 
 logger = logging.getLogger(__name__)
 
 # logger.setLevel(logging.DEBUG)
 
-IndividualType = Tuple[List[bool], float]
+
+class Individual(object):
+    """Edge toggle list of a partition with its rating. Ratings that are not exact are partial ratings, which exceed
+    the rating bound of the generation the individual was bred in, see `FitnessRater.rate_with_bound`"""
+
+    def __init__(
+            self,
+            edge_toggle_list: List[bool],
+            rating: float,
+            exact: bool = True,
+            evaluator: Optional[IncrementalEvaluator] = None,
+    ):
+        self.edge_toggle_list = edge_toggle_list
+        self.rating = rating
+        self.exact = exact
+        # State of the individual's partition, copied by its random mutations. Created on the first one
+        self.evaluator = evaluator
 
 
 class GeneticSearch(AbstractSearch):
@@ -27,8 +45,11 @@ class GeneticSearch(AbstractSearch):
         super().__init__(graph, rater)
 
         # Use list of tuples instead of dict to allow duplicates
-        self._population: List[IndividualType] = []
-        self._hof_individual: IndividualType = ([], math.inf)  # Low Rating better , inf is the worst rating
+        self._population: List[Individual] = []
+        self._hof_individual = Individual([], math.inf)  # Low Rating better , inf is the worst rating
+        # Children are rated exactly up to the worst rating of the population they are bred from, above it their
+        # rating may be partial, see `FitnessRater.rate_with_bound`
+        self._rating_bound = math.inf
 
         # Mutation Probabilities
         # Contains the factor of mutation probability
@@ -51,27 +72,27 @@ class GeneticSearch(AbstractSearch):
         for _ in range(self.configuration.n_pop):
             individual = self.random_edge_toggle_list()
             rating = self.rate_edge_toggle_list(individual)
-            self._population.append((individual, rating))
+            self._population.append(Individual(individual, rating))
 
         # Set Hall of Fame individual
         self.update_hall_of_fame(self._population)
 
-    def update_hall_of_fame(self, population: List[IndividualType]):
+    def update_hall_of_fame(self, population: List[Individual]):
         """Updates hall of fame with a better individual, if such individual exists in the given population"""
         best_individual = GeneticSearch.get_best_individual(population)
-        if best_individual[1] < self._hof_individual[1]:
+        if best_individual.rating < self._hof_individual.rating:
             self._hof_individual = best_individual
 
     @staticmethod
-    def get_best_individual(population: List[IndividualType]) -> IndividualType:
+    def get_best_individual(population: List[Individual]) -> Individual:
         """Finds the best individual of the given population and returns it"""
         best_individual = population[0]
-        for individual, rating in population:
-            if rating < best_individual[1]:
-                best_individual = (individual, rating)
+        for individual in population:
+            if individual.rating < best_individual.rating:
+                best_individual = individual
         return best_individual
 
-    def run(self) -> SpreadSheetGraph:
+    def run(self) -> Partition:
         """Explore a part of the exhaustive search space using genetic search"""
         logger.debug("Running Genetic Search...")
         self.initialize()
@@ -79,7 +100,8 @@ class GeneticSearch(AbstractSearch):
         for generation in range(self.configuration.n_gen):
             logger.debug(f"Generation {generation}")
 
-            children: List[IndividualType] = []
+            self._rating_bound = max([individual.rating for individual in self._population])
+            children: List[Individual] = []
             for _ in range(self.configuration.n_offspring):
                 children.append(self.child_from_population())
 
@@ -89,20 +111,18 @@ class GeneticSearch(AbstractSearch):
             total_generation_population = self._population + children
             self._population = self.tournament_selection(total_generation_population)
 
-        logger.debug(f"Best individual: {self._hof_individual[0]}")
-        logger.debug(f"Best rating: {self._hof_individual[1]}")
-        self.graph.edge_toggle_list = self._hof_individual[0]
-        return self.graph
+        logger.debug(f"Best individual: {self._hof_individual.edge_toggle_list}")
+        logger.debug(f"Best rating: {self._hof_individual.rating}")
+        return self.graph.partition(self._hof_individual.edge_toggle_list)
 
-    def child_from_population(self) -> IndividualType:
+    def child_from_population(self) -> Individual:
         """Generate a new individual using a parent population"""
-        potential_parents = [toggle_list for toggle_list, rating in self._population]
+        potential_parents = self._population
 
         p = random.random()
         if p < self.configuration.rand_mut_p:
             # Do random mutation
             parent = random.choice(potential_parents)
-            child = parent
 
             mutation_candidates = []
             for edge_index, mutation_probability in enumerate(self._mutation_probability_per_edge):
@@ -110,27 +130,51 @@ class GeneticSearch(AbstractSearch):
                 mutation_candidates += [edge_index] * mutation_probability
 
             mutated_index = random.choice(mutation_candidates)
-            child[mutated_index] = not child[mutated_index]
+            return self.mutated_child(parent, mutated_index)
         elif self.configuration.rand_mut_p < p < self.configuration.rand_mut_p + self.configuration.cross_mut_p:
             # Do uniform cross mutation
-            father, mother = random.sample(potential_parents, 2)
+            father, mother = [parent.edge_toggle_list for parent in random.sample(potential_parents, 2)]
 
             # For each index, randomly choose either p1 or p2 bit
             child: List[bool] = [random.choice([father[i], mother[i]]) for i in range(len(father))]
         else:
             # No mutation
-            child = random.choice(potential_parents)
-
-        return child, self.rate_edge_toggle_list(child)
-
-    def tournament_selection(self, population: List[IndividualType]) -> List[IndividualType]:
+            parent = random.choice(potential_parents)
+            return Individual(parent.edge_toggle_list, parent.rating, parent.exact, parent.evaluator)
+
+        rating = self.rate_edge_toggle_list_with_bound(child, self._rating_bound)
+        return Individual(child, rating, exact=rating <= self._rating_bound)
+
+    def mutated_child(self, parent: Individual, mutated_index: int) -> Individual:
+        """Creates a child by flipping a single edge of the parent, rated by the change of the parent's rating.
+        The child flips a copy of the parent's evaluator, the parent keeps its partition"""
+        if parent.evaluator is None:
+            exact_rating = parent.rating if parent.exact else None
+            parent.evaluator = IncrementalEvaluator(self.graph, self.rater, parent.edge_toggle_list, exact_rating)
+        evaluator = parent.evaluator.copy()
+        evaluator.flip(mutated_index)
+        # Evaluators are never flipped again once copied from, so the child can share the toggle list
+        return Individual(evaluator.edge_toggle_list, evaluator.rating, evaluator=evaluator)
+
+    def rate_exactly(self, individual: Individual):
+        """Replaces a partial rating of an individual by its exact rating"""
+        if not individual.exact:
+            individual.rating = self.rate_edge_toggle_list(individual.edge_toggle_list)
+            individual.exact = True
+
+    def tournament_selection(self, population: List[Individual]) -> List[Individual]:
         """Create a new generation out of the given population using tournament selection"""
-        survivors: List[IndividualType] = []
+        survivors: List[Individual] = []
         for _ in range(self.configuration.n_survivors):
             # Choose participants
-            rooster: List[IndividualType] = random.sample(population, self.configuration.rooster_size)
+            rooster: List[Individual] = random.sample(population, self.configuration.rooster_size)
             # Select fittest of participants as survivor
             fittest_individual_of_rooster = self.get_best_individual(rooster)
+            if not fittest_individual_of_rooster.exact:
+                # Only children with partial ratings take part, compare their exact ratings
+                for individual in rooster:
+                    self.rate_exactly(individual)
+                fittest_individual_of_rooster = self.get_best_individual(rooster)
             population.remove(fittest_individual_of_rooster)
             survivors.append(fittest_individual_of_rooster)
         return survivors
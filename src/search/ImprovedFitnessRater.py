@@ -1,12 +1,14 @@
 """Class which implements Metrics and Weight Training for Partition Evaluation"""
 import logging
-from typing import List
+from typing import List, Optional
 
+import numpy as np
 from graph.Edge import ConnectionType
 from graph.GraphComponentData import GraphComponentData
 from graph.SpreadSheetGraph import SpreadSheetGraph
 from labelregions.LabelRegionType import LabelRegionType
-from search.FitnessRater import FitnessRater, COMPONENT_BASED_METRICS, PARTITION_BASED_METRICS
+from search.FitnessRater import FitnessRater, COMPONENT_BASED_METRICS, PARTITION_BASED_METRICS, DEFAULT_CACHE_SIZE
+from search.MetricStore import MetricStore
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +20,14 @@ class ImprovedFitnessRater(FitnessRater):
     def __init__(
             self,
             weights: List[float],
-            degree_avg_cut_median: float
+            degree_avg_cut_median: float,
+            cache_size: Optional[int] = DEFAULT_CACHE_SIZE,
+            metric_store: Optional[MetricStore] = None,
     ):
 
         self.degree_avg_cut_median = degree_avg_cut_median
 
-        super().__init__(weights)
+        super().__init__(weights, cache_size, metric_store)
 
     @staticmethod
     def correct_weight_length():
@@ -39,55 +43,37 @@ class ImprovedFitnessRater(FitnessRater):
 
     @staticmethod
     def degree_avg_cut(graph):
-        d_d = [edge for edge in graph.edge_list if edge.connection_type == ConnectionType.D_D]
-        h_h = [edge for edge in graph.edge_list if edge.connection_type == ConnectionType.H_H]
+        compact = graph.compact
+        d_d = compact.edge_count_of_connection(ConnectionType.D_D)
+        h_h = compact.edge_count_of_connection(ConnectionType.H_H)
 
         try:
-            d_d_degree_avg = len(d_d) / len(ImprovedFitnessRater.data_lrs(graph))
+            d_d_degree_avg = d_d / compact.node_count_of_type(LabelRegionType.DATA)
         except ZeroDivisionError:
             d_d_degree_avg = 0
         try:
-            h_h_degree_avg = len(h_h) / len(ImprovedFitnessRater.header_lrs(graph))
+            h_h_degree_avg = h_h / compact.node_count_of_type(LabelRegionType.HEADER)
         except ZeroDivisionError:
             h_h_degree_avg = 0
         return d_d_degree_avg * h_h_degree_avg
 
-    def multi_table_prediction_score(self, graph: SpreadSheetGraph) -> float:
+    def multi_table_prediction_score(self, graph: SpreadSheetGraph, component_count: Optional[int] = None) -> float:
+        """Punishes partitions that contradict the density heuristic. Uses the components of the graph's target
+        partition, unless the number of components is given"""
         degree_avg_cut = ImprovedFitnessRater.degree_avg_cut(graph)
         likely_multi_table = degree_avg_cut <= self.degree_avg_cut_median
 
-        is_multi_table = len(graph.get_components()) > 1
+        if component_count is None:
+            component_count = len(graph.get_components())
+        is_multi_table = component_count > 1
         # Punish if the prediction is different from the density heuristic
         return is_multi_table and not likely_multi_table
 
-    def rate(self, graph: SpreadSheetGraph, edge_toggle_list: List[bool]) -> float:
-        """Rates a graph based on a edge toggle list"""
-        # Create graph copy and let it represent the partition
-
-        old_toggle_list = graph.edge_toggle_list
-        graph.edge_toggle_list = edge_toggle_list
-        components = [GraphComponentData(c, graph) for c in graph.get_components()]
-
-        degree_avg_cut_score = self.multi_table_prediction_score(graph)
-
-        graph.edge_toggle_list = old_toggle_list
-
-        scores_per_component = []
-        for component in components:
-            score = 0
-            for i, metric in enumerate(COMPONENT_BASED_METRICS):
-                metric_score = self.get_from_component_cache(graph.sheet, component, metric)
-                score += metric_score * self.weights[i]
-            scores_per_component.append(score)
-
-        scores_per_partition = []
-        for j, metric in enumerate(PARTITION_BASED_METRICS):
-            metric_score = self.get_from_partition_cache(graph.sheet, components, metric)
-            score = metric_score * self.weights[len(COMPONENT_BASED_METRICS) - 1 + j]
-            scores_per_partition.append(score)
-
-        return (
-                sum(scores_per_component) +
-                sum(scores_per_partition) +
-                degree_avg_cut_score * self.weights[-1]
-        )
+    def component_count_rating(self, graph: SpreadSheetGraph, component_count: int) -> float:
+        return self.weights[-1] * self.multi_table_prediction_score(graph, component_count)
+
+    def features_of_components(self, graph: SpreadSheetGraph, components: List[GraphComponentData]) -> np.ndarray:
+        """Adds the multi table prediction score as last feature, weighted by the last weight"""
+        features = super().features_of_components(graph, components)
+        features[-1] = self.multi_table_prediction_score(graph, len(components))
+        return features
@@ -0,0 +1,166 @@
+"""Rating of a partition that follows single edge flips, without rating the whole graph again"""
+import logging
+from copy import copy
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from graph.CompactGraph import mask_indices
+from graph.GraphComponentData import GraphComponentData
+from graph.SpreadSheetGraph import SpreadSheetGraph
+from search.FitnessRater import FitnessRater, PARTITION_METRIC_WEIGHT_INDICES, union_length
+
+logger = logging.getLogger(__name__)
+
+
+def overlap_with(box: Tuple[int, int, int, int], boxes: np.ndarray) -> int:
+    """Returns the summed overlapping area of a box with each of the given [top, left, bottom, right] boxes"""
+    top, left, bottom, right = box
+    overlapping_cols = np.minimum(boxes[:, 3], right) - np.maximum(boxes[:, 1], left) + 1
+    overlapping_rows = np.minimum(boxes[:, 2], bottom) - np.maximum(boxes[:, 0], top) + 1
+    return int((np.maximum(overlapping_cols, 0) * np.maximum(overlapping_rows, 0)).sum())
+
+
+class IncrementalEvaluator(object):
+    """Keeps the components of the current partition of a graph with their ratings.
+    Flipping an edge relabels and rates only the components containing its ends: enabling an edge between two
+    components merges them, disabling an edge splits its component if the ends are not connected otherwise.
+    The overlap of ovr is updated by the affected components only.
+    Copies follow flips independently, so the state of a partition can be kept and flipped in different ways.
+    Component ratings depend on the rater's weights, reset the evaluator after changing them"""
+
+    def __init__(
+            self,
+            graph: SpreadSheetGraph,
+            rater: FitnessRater,
+            edge_toggle_list: List[bool],
+            rating: Optional[float] = None,
+    ):
+        self.graph = graph
+        self.rater = rater
+        # The ovr metric is the only partition based metric, see `FitnessRater.PARTITION_BASED_METRICS`
+        self._ovr_weight = rater.weights[PARTITION_METRIC_WEIGHT_INDICES[0]]
+        self.reset(edge_toggle_list, rating)
+
+    def reset(self, edge_toggle_list: List[bool], rating: Optional[float] = None):
+        """Starts over from the partition of the given toggle list, rates it unless its exact rating is given"""
+        compact = self.graph.compact
+        self.edge_toggle_list = list(edge_toggle_list)
+        self._labels = compact.component_labels(self.edge_toggle_list)
+        # Node bitmask, rating and bounding box [top, left, bottom, right] of each component, by label
+        self._node_masks: Dict[int, int] = {}
+        for i, label in enumerate(self._labels):
+            self._node_masks[label] = self._node_masks.get(label, 0) | (1 << i)
+        self._component_ratings: Dict[int, float] = {}
+        self._boxes: Dict[int, Tuple[int, int, int, int]] = {}
+        for label, node_mask in self._node_masks.items():
+            self._add_component(label, node_mask)
+        boxes = self._box_array(list(self._boxes.keys()))
+        self._overlap = sum([overlap_with(boxes[i], boxes[i + 1:]) for i in range(len(boxes))])
+        if rating is None:
+            rating = self.rater.rate(self.graph.partition(self.edge_toggle_list))
+        self.rating = rating
+
+    def copy(self) -> "IncrementalEvaluator":
+        """Returns an evaluator of the same partition that is flipped independently of this one"""
+        evaluator = copy(self)
+        evaluator.edge_toggle_list = list(self.edge_toggle_list)
+        evaluator._labels = list(self._labels)
+        evaluator._node_masks = dict(self._node_masks)
+        evaluator._component_ratings = dict(self._component_ratings)
+        evaluator._boxes = dict(self._boxes)
+        return evaluator
+
+    @property
+    def partition_key(self) -> Tuple[int, ...]:
+        """See `CompactGraph.partition_key`"""
+        return tuple(sorted(self._node_masks.values()))
+
+    def _box_array(self, labels: List[int]) -> np.ndarray:
+        return np.array([self._boxes[label] for label in labels], dtype=np.int64).reshape(-1, 4)
+
+    def _add_component(self, label: int, node_mask: int):
+        """Registers and rates a component"""
+        node_indices = mask_indices(node_mask)
+        for i in node_indices:
+            self._labels[i] = label
+        self._node_masks[label] = node_mask
+        component = GraphComponentData([self.graph.nodes[i] for i in node_indices], self.graph)
+        self._component_ratings[label] = self.rater.component_rating(self.graph, component)
+        bounds = self.graph.compact.node_bounds[node_indices]
+        self._boxes[label] = (
+            int(bounds[:, 0].min()), int(bounds[:, 1].min()), int(bounds[:, 2].max()), int(bounds[:, 3].max()),
+        )
+
+    def _replace_components(self, old_labels: List[int], new_components: Dict[int, int]):
+        """Replaces the components of the old labels by the new components, given as label to node mask"""
+        for label in old_labels:
+            del self._node_masks[label], self._component_ratings[label]
+            self._overlap -= overlap_with(self._boxes.pop(label), self._box_array(list(self._boxes.keys())))
+        for label, node_mask in new_components.items():
+            self._add_component(label, node_mask)
+            others = [other for other in self._boxes.keys() if other != label]
+            self._overlap += overlap_with(self._boxes[label], self._box_array(others))
+
+    def _reachable(self, start: int, component_mask: int) -> int:
+        """Returns the node bitmask of all nodes of the component that are connected to start by enabled edges"""
+        compact = self.graph.compact
+        reached = 1 << start
+        queue = [start]
+        while queue:
+            node = queue.pop()
+            begin, end = compact.adjacency_offsets[node], compact.adjacency_offsets[node + 1]
+            for neighbour, edge in zip(compact.adjacency_nodes[begin:end].tolist(),
+                                       compact.adjacency_edges[begin:end].tolist()):
+                if self.edge_toggle_list[edge] and not reached >> neighbour & 1 and component_mask >> neighbour & 1:
+                    reached |= 1 << neighbour
+                    queue.append(neighbour)
+        return reached
+
+    def flip(self, edge_index: int) -> float:
+        """Flips an edge and returns the change of the rating"""
+        compact = self.graph.compact
+        source = int(compact.edge_sources[edge_index])
+        destination = int(compact.edge_destinations[edge_index])
+        self.edge_toggle_list[edge_index] = not self.edge_toggle_list[edge_index]
+        source_label, destination_label = self._labels[source], self._labels[destination]
+
+        if self.edge_toggle_list[edge_index]:
+            if source_label == destination_label:
+                # Both ends are connected already, the partition stays the same
+                return 0.0
+            merged_mask = self._node_masks[source_label] | self._node_masks[destination_label]
+            self._replace_components(
+                [source_label, destination_label],
+                {min(source_label, destination_label): merged_mask},
+            )
+        else:
+            component_mask = self._node_masks[source_label]
+            source_side = self._reachable(source, component_mask)
+            if source_side >> destination & 1:
+                # The ends are still connected by other edges, the partition stays the same
+                return 0.0
+            destination_side = component_mask & ~source_side
+            self._replace_components(
+                [source_label],
+                {
+                    # Labels are the lowest node index of their component
+                    (source_side & -source_side).bit_length() - 1: source_side,
+                    (destination_side & -destination_side).bit_length() - 1: destination_side,
+                },
+            )
+
+        old_rating = self.rating
+        self.rating = self.rater.memoized_rating(self.graph, self.partition_key, self._current_rating)
+        return self.rating - old_rating
+
+    def _current_rating(self) -> float:
+        """Rating of the current partition, from the component ratings and the overlap of the components"""
+        boxes = self._box_array(list(self._boxes.keys()))
+        tops, lefts, bottoms, rights = boxes.T
+        overlap_ratio = self._overlap / (union_length(lefts, rights) * union_length(tops, bottoms))
+        return (
+                sum(self._component_ratings.values())
+                + self._ovr_weight * overlap_ratio
+                + self.rater.component_count_rating(self.graph, len(self._node_masks))
+        )
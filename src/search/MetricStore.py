@@ -0,0 +1,107 @@
+"""Persistent store of component metric values, shared by all runs and worker processes on a machine"""
+import logging
+import os
+import sqlite3
+from os.path import dirname
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds a write waits for the lock of another process before giving up
+BUSY_TIMEOUT = 60
+
+
+class MetricStore(object):
+    """SQLite file of metric values keyed by graph id, component node mask, metric name and metric version.
+    The database runs in WAL mode, so any number of processes can read while one of them writes.
+    Values are never updated, only inserted, so concurrent writers of the same key always agree.
+    Writes are buffered and committed in batches of flush_size, call `flush` once a run is done"""
+
+    def __init__(self, path: str, flush_size: int = 10_000):
+        self.path = path
+        self.flush_size = flush_size
+        self._pending: List[Tuple[str, str, str, int, float]] = []
+        self._connection: Optional[sqlite3.Connection] = None
+        # Connections must not be shared with forked processes, each process opens its own
+        self._connection_pid: Optional[int] = None
+
+        self.loaded = 0
+        self.stored = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None or self._connection_pid != os.getpid():
+            if dirname(self.path) != "":
+                os.makedirs(dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT * 1000}")
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS metric_values ("
+                    "graph_id TEXT NOT NULL, component TEXT NOT NULL, metric TEXT NOT NULL, version INTEGER NOT NULL, "
+                    "value REAL NOT NULL, PRIMARY KEY (graph_id, component, metric, version)) WITHOUT ROWID"
+                )
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def _component_key(node_mask: int) -> str:
+        """Node masks exceed the integer range of SQLite on large graphs, they are stored as hex"""
+        return format(node_mask, "x")
+
+    def load_graph(self, graph_id: str, metric_names: Sequence[str], version: int) -> Dict[int, List[float]]:
+        """Returns the stored values of all metrics of all components of a graph, by component node mask.
+        Components that miss any of the metrics are left out"""
+        self.flush()
+        values: Dict[int, Dict[str, float]] = {}
+        rows = self.connection.execute(
+            "SELECT component, metric, value FROM metric_values WHERE graph_id = ? AND version = ?",
+            (graph_id, version),
+        )
+        for component, metric, value in rows:
+            values.setdefault(int(component, 16), {})[metric] = value
+
+        complete = {}
+        for node_mask, metric_values in values.items():
+            if all([name in metric_values for name in metric_names]):
+                complete[node_mask] = [metric_values[name] for name in metric_names]
+        self.loaded += len(complete)
+        return complete
+
+    def put(self, graph_id: str, node_mask: int, metric_values: Dict[str, float], version: int):
+        """Adds the metric values of a component, written with the next flush"""
+        self.stored += 1
+        component = MetricStore._component_key(node_mask)
+        self._pending.extend(
+            (graph_id, component, metric, version, float(value)) for metric, value in metric_values.items()
+        )
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """Commits all pending values"""
+        if len(self._pending) == 0:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO metric_values (graph_id, component, metric, version, value) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    pending,
+                )
+        except sqlite3.OperationalError as e:
+            # The store is only a cache, losing values costs time but not correctness
+            logger.warning(f"Dropping {len(pending)} metric values, the metric store is not writable: {e}")
+
+    def close(self):
+        self.flush()
+        if self._connection is not None and self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def statistics(self) -> Dict[str, int]:
+        return {"loaded": self.loaded, "stored": self.stored, "pending": len(self._pending)}
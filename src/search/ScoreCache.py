@@ -0,0 +1,96 @@
+"""Bounded cache for scores of graph partitions and components"""
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreCache(object):
+    """LRU cache from graph id and key to score. Holds at most max_entries scores (None for no limit),
+    evicting the least recently used ones. Entries of a graph can be dropped once the graph is not rated anymore"""
+
+    def __init__(self, max_entries: Optional[int] = 1_000_000):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("A score cache needs room for at least one entry")
+        self.max_entries = max_entries
+        self._scores: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._keys_per_graph: Dict[str, Set[Hashable]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, graph_id: str, key: Hashable, score: Callable[[], float]) -> float:
+        """Returns the cached score of the key, calculates and caches it on a miss"""
+        entry_key = (graph_id, key)
+        if entry_key in self._scores:
+            self.hits += 1
+            self._scores.move_to_end(entry_key)
+            return self._scores[entry_key]
+
+        self.misses += 1
+        value = score()
+        self.put(graph_id, key, value)
+        return value
+
+    def put(self, graph_id: str, key: Hashable, value: float):
+        """Caches the score of the key, replaces any score it had before"""
+        entry_key = (graph_id, key)
+        self._scores[entry_key] = value
+        self._scores.move_to_end(entry_key)
+        self._keys_per_graph.setdefault(graph_id, set()).add(entry_key)
+        if self.max_entries is not None and len(self._scores) > self.max_entries:
+            self._evict()
+
+    def find(self, graph_id: str, key: Hashable) -> Optional[float]:
+        """Returns the cached score of the key, None if it is not cached. Misses are not counted"""
+        entry_key = (graph_id, key)
+        if entry_key not in self._scores:
+            return None
+        self.hits += 1
+        self._scores.move_to_end(entry_key)
+        return self._scores[entry_key]
+
+    def discard(self, graph_id: str, key: Hashable):
+        """Drops the entry of the key, if it is cached"""
+        entry_key = (graph_id, key)
+        if entry_key in self._scores:
+            del self._scores[entry_key]
+            graph_keys = self._keys_per_graph[graph_id]
+            graph_keys.discard(entry_key)
+            if len(graph_keys) == 0:
+                del self._keys_per_graph[graph_id]
+
+    def _evict(self):
+        """Drops the least recently used entry"""
+        (graph_id, key), _ = self._scores.popitem(last=False)
+        graph_keys = self._keys_per_graph[graph_id]
+        graph_keys.discard((graph_id, key))
+        if len(graph_keys) == 0:
+            del self._keys_per_graph[graph_id]
+        self.evictions += 1
+
+    def drop_graph(self, graph_id: str) -> int:
+        """Drops all entries of a graph, returns the number of dropped entries"""
+        graph_keys = self._keys_per_graph.pop(graph_id, set())
+        for entry_key in graph_keys:
+            del self._scores[entry_key]
+        return len(graph_keys)
+
+    def clear(self):
+        """Drops all entries, keeps the counters"""
+        self._scores.clear()
+        self._keys_per_graph.clear()
+
+    def statistics(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._scores),
+            "graphs": len(self._keys_per_graph),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self):
+        return len(self._scores)
@@ -0,0 +1,96 @@
+"""Implements an exact search over the partitions of SpreadsheetGraphs into connected components"""
+import logging
+from typing import Dict, List, Tuple
+
+from graph.CompactGraph import mask_indices
+from graph.ConnectedPartitions import ConnectedPartitions
+from graph.GraphComponentData import GraphComponentData
+from graph.Partition import Partition
+from search.AbstractSearch import AbstractSearch
+
+logger = logging.getLogger(__name__)
+
+
+class SubsetDPSearch(AbstractSearch):
+    """Finds the fittest partition of a graph, like the exhaustive search, but over node subsets instead of edge subsets.
+    Components are connected node subsets, see `ConnectedPartitions`. The sum of the component ratings is minimized by
+    dynamic programming over the remaining nodes: the component of the lowest remaining node plus the best partition
+    of all other remaining nodes. The partition based terms of the rating (ovr and the multi table prediction) are not
+    additive, but never negative, so the dynamic programming result is a lower bound. A branch and bound over the
+    components then verifies the fittest partition, pruning every branch whose bound is not better than the fittest
+    rating so far. Requires non negative weights"""
+
+    def run(self) -> Partition:
+        logger.debug("Running Subset DP Search...")
+        if min(self.rater.weights) < 0:
+            raise ValueError("Subset DP Search requires non negative weights!")
+
+        self._connected_partitions = ConnectedPartitions(self.graph)
+        # Rating of each rated component and best additive rating of each partitioned node set, by node mask
+        self._component_ratings: Dict[int, float] = {}
+        self._best_additive: Dict[int, Tuple[float, int]] = {0: (0.0, 0)}
+
+        all_nodes = self._connected_partitions.all_nodes
+        # The fittest partition in regard of the component ratings is the first incumbent
+        self._fittest_components = self.additive_optimum(all_nodes)
+        self._fittest_rating = self.rate_components(self._fittest_components)
+        self.verify(all_nodes, 0.0, [])
+
+        logger.debug(f"Best rating: {self._fittest_rating}")
+        return self._connected_partitions.partition(self._fittest_components)
+
+    def component_rating(self, component_mask: int) -> float:
+        """Returns the weighted component based metrics of the component of the given nodes"""
+        rating = self._component_ratings.get(component_mask, None)
+        if rating is None:
+            nodes = [self.graph.nodes[i] for i in mask_indices(component_mask)]
+            rating = self.rater.component_rating(self.graph, GraphComponentData(nodes, self.graph))
+            self._component_ratings[component_mask] = rating
+        return rating
+
+    def best_additive_rating(self, remaining: int) -> float:
+        """Returns the lowest sum of component ratings over all partitions of the remaining nodes"""
+        if remaining not in self._best_additive:
+            best = None
+            for component_mask in self._connected_partitions.lowest_node_subsets(remaining):
+                rating = self.component_rating(component_mask) + self.best_additive_rating(remaining & ~component_mask)
+                if best is None or rating < best[0]:
+                    best = (rating, component_mask)
+            self._best_additive[remaining] = best
+        return self._best_additive[remaining][0]
+
+    def additive_optimum(self, remaining: int) -> List[int]:
+        """Returns the components of the partition of the remaining nodes with the lowest sum of component ratings"""
+        components = []
+        while remaining:
+            self.best_additive_rating(remaining)
+            component_mask = self._best_additive[remaining][1]
+            components.append(component_mask)
+            remaining &= ~component_mask
+        return components
+
+    def verify(self, remaining: int, partial_rating: float, components: List[int]):
+        """Branch and bound over the component of the lowest remaining node, rates complete partitions exactly"""
+        if remaining == 0:
+            rating = self.rate_components(components)
+            if rating < self._fittest_rating:
+                self._fittest_rating = rating
+                self._fittest_components = list(components)
+            return
+
+        branches = []
+        for component_mask in self._connected_partitions.lowest_node_subsets(remaining):
+            rest = remaining & ~component_mask
+            partial = partial_rating + self.component_rating(component_mask)
+            branches.append((partial + self.best_additive_rating(rest), partial, component_mask, rest))
+        # Most promising branches first, so the incumbent improves early
+        for lower_bound, partial, component_mask, rest in sorted(branches):
+            if lower_bound >= self._fittest_rating:
+                break
+            components.append(component_mask)
+            self.verify(rest, partial, components)
+            components.pop()
+
+    def rate_components(self, components: List[int]) -> float:
+        """Rates the partition into the given components exactly"""
+        return self.rater.rate(self._connected_partitions.partition(components))